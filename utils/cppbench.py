@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""
+Compare the extraction of the preprocessor directives by waflib.Tools.c_preproc.filter_comments
+with the regular expressions applied to the whole text on large headers, and check that both return
+the same lines. The headers smaller than c_preproc.mmap_size are processed by the regular expressions
+in both cases. The generated header is written to a temporary folder and removed after the run.
+
+Run from the top-level directory of the waf source tree
+"""
+
+import os, sys, re, time, random, tempfile, shutil
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from waflib import Utils
+from waflib.Tools import c_preproc
+
+HELP_USAGE = """Usage: cppbench.py [size_in_MB] [file1 file2 ...]
+    size_in_MB - Size of the generated header containing tables (default 50)
+    files      - Optional headers to process instead of the generated one
+"""
+
+def regex_filter(filename):
+    code = Utils.readf(filename)
+    code = c_preproc.re_nl.sub('', code)
+    code = c_preproc.re_cpp.sub(c_preproc.repl, code)
+    return [(m.group(2), m.group(3)) for m in re.finditer(c_preproc.re_lines, code)]
+
+def generate(path, size):
+    rnd = random.Random(0)
+    f = open(path, 'w')
+    try:
+        f.write('#ifndef TABLES_H\n#define TABLES_H\n#include <stdint.h>\n')
+        total = 0
+        t = 0
+        while total < size * 1024 * 1024:
+            f.write('/* table %d */\nstatic const uint8_t table%d[] = {\n' % (t, t))
+            for l in range(1000):
+                line = '  ' + ', '.join('0x%02x' % rnd.randrange(256) for x in range(16)) + ', // row %d\n' % l
+                f.write(line)
+                total += len(line)
+            f.write('};\n#define TABLE%d_SIZE %d\n' % (t, 16000))
+            t += 1
+        f.write('#endif\n')
+    finally:
+        f.close()
+
+def main():
+    args = sys.argv[1:]
+    if args and args[0] in ('-h', '--help'):
+        print(HELP_USAGE)
+        return
+
+    size = 50
+    if args and not os.path.isfile(args[0]):
+        size = int(args.pop(0))
+    files = args
+    tmp = None
+    if not files:
+        tmp = tempfile.mkdtemp(prefix='cppbench')
+        files = [os.path.join(tmp, 'cppbench_tables.h')]
+        generate(files[0], size)
+
+    try:
+        print('%-30s %10s %12s %12s %8s' % ('file', 'MB', 'regex (s)', 'single (s)', 'same'))
+        for x in files:
+            t = time.time()
+            a = regex_filter(x)
+            t1 = time.time() - t
+            t = time.time()
+            b = c_preproc.filter_comments(x)
+            t2 = time.time() - t
+            print('%-30s %10.1f %12.3f %12.3f %8s' % (os.path.basename(x)[-30:], os.stat(x).st_size / 1024. / 1024, t1, t2, a == b))
+    finally:
+        if tmp:
+            shutil.rmtree(tmp)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""
+Compare the throughput of the hash algorithms available for the signatures
+(waf configure --hash=... --hash-size=...) on large binary inputs.
+
+The data is read by blocks of 100000 bytes like waflib.Utils.h_file does
+"""
+
+import os, sys, time, hashlib
+
+HELP_USAGE = """Usage: hashbench.py [size_in_MB] [file1 file2 ...]
+    size_in_MB - Size of the random buffer to hash (default 256)
+    files      - Optional files to hash instead of the random buffer (object files, archives, ...)
+"""
+
+BLOCK = 100000
+
+def algorithms():
+    lst = [('md5', hashlib.md5), ('sha1', hashlib.sha1)]
+    if hasattr(hashlib, 'blake2b'):
+        for size in (16, 20, 32, 64):
+            def fun(size=size):
+                return hashlib.blake2b(digest_size=size)
+            lst.append(('blake2b-%d' % size, fun))
+    return lst
+
+def hash_buffer(fun, data):
+    m = fun()
+    for i in range(0, len(data), BLOCK):
+        m.update(data[i:i + BLOCK])
+    return m.digest()
+
+def hash_files(fun, files):
+    for x in files:
+        m = fun()
+        f = open(x, 'rb')
+        try:
+            while True:
+                buf = f.read(BLOCK)
+                if not buf:
+                    break
+                m.update(buf)
+        finally:
+            f.close()
+
+def main():
+    args = sys.argv[1:]
+    if args and args[0] in ('-h', '--help'):
+        print(HELP_USAGE)
+        return
+
+    size = 256
+    if args and not os.path.isfile(args[0]):
+        size = int(args.pop(0))
+    files = args
+
+    if files:
+        total = sum(os.stat(x).st_size for x in files)
+        run = lambda fun: hash_files(fun, files)
+        # read the files once so that the first algorithm is not penalized by the disk
+        hash_files(hashlib.md5, files)
+    else:
+        total = size * 1024 * 1024
+        data = os.urandom(total)
+        run = lambda fun: hash_buffer(fun, memoryview(data))
+
+    print('%-12s %10s %10s' % ('algorithm', 'time (s)', 'MB/s'))
+    for (name, fun) in algorithms():
+        t = time.time()
+        run(fun)
+        d = max(time.time() - t, 1e-9)
+        print('%-12s %10.3f %10.1f' % (name, d, total / d / 1024 / 1024))
+
+if __name__ == '__main__':
+    main()
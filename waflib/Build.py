@@ -9,9 +9,12 @@ The inheritance tree is the following:
 
 """
 
-import os, sys, errno, re, datetime, shutil
+import os, sys, errno, re, datetime, shutil, time, struct, zlib, json
+from io import BytesIO
 try: import cPickle
 except: import pickle as cPickle
+try: import fcntl
+except ImportError: fcntl = None
 from waflib import Runner, TaskGen, Utils, ConfigSet, Task, Logs, Options, Context, Errors
 import waflib.Node
 
@@ -27,12 +30,24 @@ INSTALL = 1337
 UNINSTALL = -1337
 """Negative value '<-' uninstall, see :py:attr:`waflib.Build.BuildContext.is_install`"""
 
-SAVED_ATTRS = 'root node_deps raw_deps task_sigs'.split()
-"""Build class members to save between the runs (root, node_deps, raw_deps, task_sigs)"""
+SAVED_ATTRS = 'root node_deps raw_deps task_sigs file_sigs'.split()
+"""Build class members to save between the runs (root, node_deps, raw_deps, task_sigs, file_sigs)"""
+
+SHARDED_ATTRS = 'node_deps raw_deps task_sigs'.split()
+"""Build class members saved in one file per task generator folder, see :py:meth:`waflib.Build.BuildContext.load_shards`"""
+
+JOURNAL_ATTRS = ['file_sigs']
+"""Build class members whose changed entries are appended to the journal, see :py:meth:`waflib.Build.BuildContext.store_journal`"""
+
+JOURNAL_RATIO = 0.5
+"""The journal is merged into a new snapshot of the build data when its size exceeds this fraction of the snapshot size"""
 
 CFG_FILES = 'cfg_files'
 """Files from the build directory to hash before starting the build (``config.h`` written during the configuration)"""
 
+STATS = 'restore recurse post_group set_file_constraints set_precedence_constraints hash_files prescan signature scan hash_cache_miss execute store'.split()
+"""Build phases reported by ``waf --stats``, in this order (see :py:meth:`waflib.Build.BuildContext.add_stat`)"""
+
 POST_AT_ONCE = 0
 """Post mode: all task generators are posted before the build really starts"""
 
@@ -61,6 +76,42 @@ class BuildContext(Context.Context):
 		self.post_mode = POST_AT_ONCE
 		"""post the task generators at once, group-by-group, or both"""
 
+		self.pools = {}
+		"""
+		Resource pools (name to amount) limiting the tasks executed at the same time, see :py:attr:`waflib.Task.TaskBase.resources`.
+		The pools are initialized from the command-line, for example ``waf --pools=link=2,memory_gb=64``
+		"""
+		for x in Utils.to_list(Options.options.pools.replace(',', ' ')):
+			try:
+				(k, v) = x.split('=')
+				self.pools[k] = float(v)
+			except ValueError:
+				raise Errors.WafError('Invalid resource pool %r (use name=amount)' % x)
+
+		self.restat = Options.options.restat
+		"""
+		Give the output nodes the signature of their contents instead of the signature of the task
+		that created them (see :py:meth:`waflib.Task.Task.post_run`). The tasks depending on outputs
+		rebuilt with identical contents are then skipped (early cutoff), at the cost of hashing all the outputs.
+		"""
+
+		self.prescan_jobs = Options.options.prescan and Options.options.jobs or 0
+		"""
+		Amount of worker processes or threads scanning the dependencies of the tasks before they are executed,
+		see :py:meth:`waflib.Build.BuildContext.prescan` (``waf --prescan``)
+		"""
+
+		self.scan_queue = None
+		"""Tasks waiting for a scan, collected by :py:meth:`waflib.Build.BuildContext.prescan`"""
+
+		self.pipeline = Options.options.pipeline
+		"""
+		Start the tasks of the next build groups before the tasks of the current group are complete.
+		The tasks of a group then wait only for the tasks of previous groups producing their inputs
+		or declared to run before them (see :py:func:`waflib.Task.set_pipeline_constraints`).
+		This has no effect when the task generators are posted lazily (:py:const:`waflib.Build.POST_LAZY`).
+		"""
+
 		# output directory - may be set until the nodes are considered
 		self.out_dir = kw.get('out_dir', Context.out_dir)
 
@@ -83,6 +134,47 @@ class BuildContext(Context.Context):
 		self.raw_deps = {}
 		"""Dict of custom data returned by :py:meth:`waflib.Task.Task.scan` (persists between build executions)"""
 
+		self.file_sigs = {}
+		"""
+		Hashes of the source files with the file status when they were computed, see :py:meth:`waflib.Node.Node.h_file`
+		(persists between build executions, cleared by ``waf --rehash``)
+		"""
+
+		self.hash_count = 0
+		"""Amount of source files hashed before the task signatures are computed, see :py:meth:`waflib.Build.BuildContext.hash_tasks`"""
+
+		self.hash_time = 0.
+		"""Time spent hashing the source files in :py:meth:`waflib.Build.BuildContext.hash_tasks`"""
+
+		self.file_sigs_dirty = False
+		"""Set when file hashes are added to :py:attr:`waflib.Build.BuildContext.file_sigs`, the build data must then be saved"""
+
+		self.stats = None
+		"""
+		Amount of calls and time spent (name to [count, time]) for each build phase listed in :py:const:`waflib.Build.STATS`,
+		collected only when ``waf --stats`` or ``waf --stats-json=FILE`` is given, see :py:meth:`waflib.Build.BuildContext.add_stat`
+		"""
+		if Options.options.stats or Options.options.stats_json:
+			self.stats = {}
+
+		self.stats_lock = Utils.threading.Lock()
+		"""Lock for :py:meth:`waflib.Build.BuildContext.add_stat`, the task execution times are added by the consumer threads"""
+
+		self.journal_id = None
+		"""Identifier of the snapshot of the build data the journal applies to, a new snapshot is written by :py:meth:`waflib.Build.BuildContext.store` when None"""
+
+		self.journal_base = {}
+		"""Copies of the members listed in :py:const:`waflib.Build.JOURNAL_ATTRS` when the build data was loaded or stored"""
+
+		self.journal_size = 0
+		"""Size of the journal in bytes"""
+
+		self.snapshot_size = 0
+		"""Size of the snapshot of the build data in bytes"""
+
+		self.shards = {}
+		"""Entries of :py:const:`waflib.Build.SHARDED_ATTRS` by shard name, as loaded or last stored"""
+
 		# list of folders that are already scanned
 		# so that we do not need to stat them one more time
 		self.cache_dir_contents = {}
@@ -210,11 +302,16 @@ class BuildContext(Context.Context):
 		"""
 		Restore the data from previous builds and call :py:meth:`waflib.Build.BuildContext.execute_build`. Overrides from :py:func:`waflib.Context.Context.execute`
 		"""
-		self.restore()
-		if not self.all_envs:
-			self.load_envs()
+		start = time.time()
+		try:
+			self.restore()
+			self.add_stat('restore', time.time() - start)
+			if not self.all_envs:
+				self.load_envs()
 
-		self.execute_build()
+			self.execute_build()
+		finally:
+			self.report_stats(time.time() - start)
 
 	def execute_build(self):
 		"""
@@ -227,7 +324,9 @@ class BuildContext(Context.Context):
 		"""
 
 		Logs.info("Waf: Entering directory `%s'" % self.variant_dir)
+		t = time.time()
 		self.recurse([self.run_dir])
+		self.add_stat('recurse', time.time() - t)
 		self.pre_build()
 
 		# display the time elapsed in the progress bar
@@ -251,12 +350,15 @@ class BuildContext(Context.Context):
 		try:
 			env = ConfigSet.ConfigSet(os.path.join(self.cache_dir, 'build.config.py'))
 		except (IOError, OSError):
-			pass
+			Utils.set_hash('md5')
 		else:
 			if env['version'] < Context.HEXVERSION:
 				raise Errors.WafError('Version mismatch! reconfigure the project')
 			for t in env['tools']:
 				self.setup(**t)
+			Utils.set_hash(*(env['hash_type'] or ['md5']))
+
+		self.wait_store()
 
 		f = None
 		try:
@@ -266,48 +368,521 @@ class BuildContext(Context.Context):
 				# handle missing file/empty file
 				Logs.debug('build: could not load the build cache (missing)')
 			else:
+				# the node tree is stored first, the other objects refer to the nodes by position
 				try:
-					waflib.Node.pickle_lock.acquire()
-					waflib.Node.Nod3 = self.node_class
-					try:
-						data = cPickle.load(f)
-					except Exception as e:
-						Logs.debug('build: could not load the build cache %r' % e)
+					head = cPickle.load(f)
+					# the folders are created when accessed
+					nodes = waflib.Node.unpack_tree(self.node_class, head['nodes'])
+					self.root = nodes.root
+
+					if head['hash_algo'] != Utils.hash_algo:
+						# the signatures and the task identifiers (keys) cannot be compared
+						Logs.debug('build: the hash algorithm changed, discarding the signatures')
 					else:
+						def load_node(pid):
+							try:
+								return nodes[pid]
+							except TypeError:
+								return self.root.make_node(pid)
+						u = cPickle.Unpickler(f)
+						u.persistent_load = load_node
+						data = u.load()
 						for x in SAVED_ATTRS:
-							setattr(self, x, data[x])
-				finally:
-					waflib.Node.pickle_lock.release()
+							if x in data and not x in SHARDED_ATTRS:
+								setattr(self, x, data[x])
+						self.journal_id = head['journal_id']
+						self.snapshot_size = os.fstat(f.fileno()).st_size
+				except Exception as e:
+					Logs.debug('build: could not load the build cache %r' % e)
 		finally:
 			if f:
 				f.close()
 
+		if self.journal_id:
+			self.load_journal()
+
+		if Options.options.rehash:
+			self.file_sigs = {}
+		self.journal_base = dict((x, dict(getattr(self, x))) for x in JOURNAL_ATTRS)
+
 		self.init_dirs()
 
+	def load_journal(self):
+		"""
+		Apply the records of the journal written by :py:meth:`waflib.Build.BuildContext.store_journal` to the
+		data loaded from the snapshot. A journal written for another snapshot is ignored, and the records
+		following a truncated or corrupted one (interrupted build) are discarded; in both cases the next call
+		to :py:meth:`waflib.Build.BuildContext.store` writes a new snapshot.
+		"""
+		try:
+			f = open(os.path.join(self.variant_dir, Context.DBFILE + '.log'), 'rb')
+		except (IOError, OSError):
+			Logs.debug('build: could not load the journal (missing)')
+			self.journal_id = None
+			return
+
+		def load(payload):
+			u = cPickle.Unpickler(BytesIO(payload))
+			u.persistent_load = self.root.make_node
+			return u.load()
+
+		try:
+			first = True
+			while 1:
+				head = f.read(8)
+				if not head:
+					break
+				payload = None
+				if len(head) == 8:
+					(size, crc) = struct.unpack('>II', head)
+					payload = f.read(size)
+					if len(payload) != size or zlib.crc32(payload) & 0xffffffff != crc:
+						payload = None
+				if payload is None:
+					Logs.debug('build: discarding the truncated records of the journal')
+					self.journal_id = None
+					break
+
+				rec = load(payload)
+				if first:
+					first = False
+					if rec.get('journal_id') != self.journal_id:
+						Logs.debug('build: the journal does not match the build data')
+						self.journal_id = None
+						break
+					continue
+
+				for x in JOURNAL_ATTRS:
+					tbl = getattr(self, x)
+					tbl.update(rec[x])
+					for k in rec['deleted'][x]:
+						tbl.pop(k, None)
+				for (node, sig) in rec['nodes']:
+					node.sig = sig
+				self.journal_size = f.tell()
+		finally:
+			f.close()
+
+	def store_journal(self):
+		"""
+		Append the entries of :py:const:`waflib.Build.JOURNAL_ATTRS` changed since the build data was loaded
+		(different values), and the signatures of the outputs of the tasks executed, to the journal.
+		Each record is preceded by its size and checksum so that a partial write is detected when loading.
+		The nodes are saved by path, see :py:meth:`waflib.Build.BuildContext.load_journal`.
+		"""
+		rec = {'nodes': [], 'deleted': {}}
+		count = 0
+		for x in JOURNAL_ATTRS:
+			cur = getattr(self, x)
+			base = self.journal_base.get(x, {})
+			# the values are compared by identity first, the racy files are hashed again with the same results
+			rec[x] = dict((k, v) for (k, v) in cur.items() if base.get(k, rec) is not v and base.get(k, rec) != v)
+			rec['deleted'][x] = [k for k in base if not k in cur]
+			count += len(rec[x]) + len(rec['deleted'][x])
+		for tsk in getattr(self, 'returned_tasks', []):
+			for node in getattr(tsk, 'outputs', []):
+				rec['nodes'].append((node, getattr(node, 'sig', None)))
+				count += 1
+		if not count:
+			return
+
+		def node_path(obj):
+			if isinstance(obj, waflib.Node.Node):
+				return waflib.Node.node_path(obj)
+			return None
+
+		buf = BytesIO()
+		p = cPickle.Pickler(buf, -1)
+		p.persistent_id = node_path
+		p.dump(rec)
+		payload = buf.getvalue()
+
+		f = open(os.path.join(self.variant_dir, Context.DBFILE + '.log'), 'ab')
+		try:
+			f.write(struct.pack('>II', len(payload), zlib.crc32(payload) & 0xffffffff) + payload)
+		finally:
+			f.close()
+
+		Logs.debug('build: %d entries appended to the journal' % count)
+		self.journal_size += len(payload) + 8
+		self.journal_base = dict((x, dict(getattr(self, x))) for x in JOURNAL_ATTRS)
+
+	def shard_name(self, node):
+		"""
+		Name of the file holding the entries of :py:const:`waflib.Build.SHARDED_ATTRS` for the
+		tasks of the task generators of a folder
+
+		:param node: folder of the task generators
+		:type node: :py:class:`waflib.Node.Node`
+		:rtype: string
+		"""
+		rel = node.path_from(self.srcnode).replace(os.sep, '/')
+		return 'shard-' + re.sub('[^A-Za-z0-9_.-]', lambda m: '%%%02x' % ord(m.group(0)), rel)
+
+	def load_shards(self, tasks):
+		"""
+		Load the entries of :py:const:`waflib.Build.SHARDED_ATTRS` saved for the folders of the task generators
+		of the tasks given, before the tasks are examined (see :py:meth:`waflib.Build.BuildContext.get_build_iterator`).
+		A build restricted by ``--targets`` or by the launch directory only loads the data for the folders it touches.
+
+		:param tasks: tasks
+		:type tasks: list of :py:class:`waflib.Task.TaskBase`
+		"""
+		seen = set()
+		for tsk in tasks:
+			path = getattr(tsk.generator, 'path', self.srcnode)
+			if not id(path) in seen:
+				seen.add(id(path))
+				self.load_shard(self.shard_name(path))
+
+	def load_shard(self, name):
+		"""
+		Load a file written by :py:meth:`waflib.Build.BuildContext.store_shards`, the entries already present are kept.
+		The file is ignored if it cannot be read or if the signatures were computed with another hash algorithm.
+
+		:param name: name of the shard, see :py:meth:`waflib.Build.BuildContext.shard_name`
+		:type name: string
+		"""
+		if name in self.shards:
+			return
+		data = self.shards[name] = dict((x, {}) for x in SHARDED_ATTRS)
+
+		try:
+			f = open(os.path.join(self.variant_dir, Context.DBFILE + '.d', name), 'rb')
+		except (IOError, OSError):
+			return
+		try:
+			try:
+				u = cPickle.Unpickler(f)
+				u.persistent_load = self.root.make_node
+				tmp = u.load()
+				if tmp['hash_algo'] != Utils.hash_algo:
+					Logs.debug('build: the hash algorithm changed, discarding %r' % name)
+					return
+				for x in SHARDED_ATTRS:
+					data[x] = tmp[x]
+				data['stale'] = tmp.get('stale', {})
+			except Exception as e:
+				Logs.debug('build: could not load the shard %r %r' % (name, e))
+				return
+		finally:
+			f.close()
+
+		for x in SHARDED_ATTRS:
+			tbl = getattr(self, x)
+			for (k, v) in data[x].items():
+				if not k in tbl:
+					tbl[k] = v
+
+	def store_shards(self):
+		"""
+		Write the files for the shards whose entries changed since they were loaded (compared by identity).
+		The entries are assigned to the shards of the task generators of the tasks posted; the other
+		entries stay in their shard, or go to the shard of the top-level folder if they are new.
+		"""
+		names = {}
+		tasks = {}
+		complete = True
+		for g in self.groups:
+			for tg in g:
+				if isinstance(tg, Task.TaskBase):
+					lst = [tg]
+				else:
+					lst = getattr(tg, 'tasks', [])
+					if not getattr(tg, 'posted', None):
+						complete = False
+				for tsk in lst:
+					if isinstance(tsk, Task.Task):
+						path = getattr(tsk.generator, 'path', self.srcnode)
+						try:
+							name = names[id(path)]
+						except KeyError:
+							name = names[id(path)] = self.shard_name(path)
+						tasks[tsk.uid()] = name
+		top = self.shard_name(self.srcnode)
+
+		dname = os.path.join(self.variant_dir, Context.DBFILE + '.d')
+		age = Options.options.gc
+		if age > 0 and complete:
+			# the shards of the folders without task generators age too
+			for x in self.list_shards():
+				self.load_shard(x)
+
+		while 1:
+			owner = {}
+			for (name, data) in self.shards.items():
+				for x in SHARDED_ATTRS:
+					for k in data[x]:
+						owner[k] = name
+			owner.update(tasks)
+
+			new = {}
+			for x in SHARDED_ATTRS:
+				for (k, v) in getattr(self, x).items():
+					if isinstance(k, tuple) and k[0] in tasks:
+						name = tasks[k[0]]
+					else:
+						name = owner.get(k, top)
+					try:
+						dct = new[name]
+					except KeyError:
+						dct = new[name] = dict((y, {}) for y in SHARDED_ATTRS)
+					dct[x][k] = v
+
+			# the other entries of a shard not loaded must be written too
+			missing = [x for x in new if not x in self.shards]
+			if not missing:
+				break
+			for x in missing:
+				self.load_shard(x)
+
+		if age > 0 and complete:
+			count = self.age_shards(new, tasks, age)
+			if count:
+				Logs.info('Waf: removed the build data of %d old tasks' % count)
+
+		def changed(old, cur):
+			if old.get('stale', {}) != cur.get('stale', {}):
+				return True
+			for x in SHARDED_ATTRS:
+				a = old[x]
+				b = cur[x]
+				if len(a) != len(b):
+					return True
+				for (k, v) in b.items():
+					if a.get(k, a) is not v:
+						return True
+			return False
+
+		def node_path(obj):
+			if isinstance(obj, waflib.Node.Node):
+				return waflib.Node.node_path(obj)
+			return None
+
+		for (name, old) in list(self.shards.items()):
+			cur = new.get(name, None) or dict((y, {}) for y in SHARDED_ATTRS)
+			if not 'stale' in cur:
+				cur['stale'] = dict((k, v) for (k, v) in old.get('stale', {}).items() if self.in_shards(k))
+			if not changed(old, cur):
+				continue
+
+			self.shards[name] = cur
+			if not cur['stale'] and not [x for x in SHARDED_ATTRS if cur[x]]:
+				try:
+					os.remove(os.path.join(dname, name))
+				except OSError:
+					pass
+				else:
+					Logs.debug('build: removed the shard %r' % name)
+				continue
+
+			Utils.check_dir(dname)
+			data = {'hash_algo': Utils.hash_algo}
+			data.update(cur)
+			f = open(os.path.join(dname, name + '.tmp'), 'wb')
+			try:
+				p = cPickle.Pickler(f, -1)
+				p.persistent_id = node_path
+				p.dump(data)
+			finally:
+				f.close()
+			os.rename(os.path.join(dname, name + '.tmp'), os.path.join(dname, name))
+			Logs.debug('build: stored the shard %r' % name)
+
+	def list_shards(self):
+		"""
+		:return: the names of the shards present on disk, see :py:meth:`waflib.Build.BuildContext.store_shards`
+		:rtype: list of string
+		"""
+		try:
+			lst = os.listdir(os.path.join(self.variant_dir, Context.DBFILE + '.d'))
+		except OSError:
+			return []
+		return [x for x in lst if not x.endswith('.tmp')]
+
+	def in_shards(self, k):
+		"""
+		:return: True if the key is present in one of the members listed in :py:const:`waflib.Build.SHARDED_ATTRS`
+		:rtype: bool
+		"""
+		for x in SHARDED_ATTRS:
+			if k in getattr(self, x):
+				return True
+		return False
+
+	def task_uid(self, k):
+		"""
+		:return: the task identifier (:py:meth:`waflib.Task.Task.uid`) a key of :py:const:`waflib.Build.SHARDED_ATTRS`
+			is based on, or None for the keys set by the tools for other purposes
+		"""
+		if isinstance(k, tuple):
+			k = k[0]
+		sample = Utils.h_list([])
+		if type(k) is type(sample) and len(k) == len(sample):
+			return k
+		return None
+
+	def age_shards(self, new, tasks, age):
+		"""
+		Count the complete builds (all task generators posted) in which the entries of
+		:py:const:`waflib.Build.SHARDED_ATTRS` were not used by any task, and remove the
+		entries unused for ``age`` builds (``waf --gc=age``). The counters are kept in the shards,
+		which are written after each complete build, including the builds executing no task.
+
+		:param new: entries by shard name, see :py:meth:`waflib.Build.BuildContext.store_shards`
+		:type new: dict
+		:param tasks: shard names by task identifier for the tasks of the build
+		:type tasks: dict
+		:param age: amount of builds
+		:type age: int
+		:return: amount of tasks whose entries were removed
+		:rtype: int
+		"""
+		removed = set()
+		for (name, dct) in new.items():
+			old = self.shards[name].get('stale', {})
+			stale = dct['stale'] = {}
+			for x in SHARDED_ATTRS:
+				tbl = dct[x]
+				for k in list(tbl.keys()):
+					uid = self.task_uid(k)
+					if uid is None or uid in tasks:
+						continue
+					n = stale.get(k, None) or old.get(k, 0) + 1
+					if n >= age:
+						del tbl[k]
+						getattr(self, x).pop(k, None)
+						removed.add(uid)
+					else:
+						stale[k] = n
+		return len(removed)
+
+	def gc(self):
+		"""
+		Remove the build data of the tasks that are not created by the task generators any more
+		(renamed or removed targets, changed flags), and the nodes of the files that do not exist
+		and are not used by the tasks. The task generators must be posted. Called by ``waf gc``.
+		"""
+		def db_size():
+			ret = 0
+			lst = [Context.DBFILE, Context.DBFILE + '.log'] + [os.path.join(Context.DBFILE + '.d', x) for x in self.list_shards()]
+			for x in lst:
+				try:
+					ret += os.stat(os.path.join(self.variant_dir, x)).st_size
+				except OSError:
+					pass
+			return ret
+		size = db_size()
+
+		for x in self.list_shards():
+			self.load_shard(x)
+
+		uids = set()
+		keep = set()
+		for g in self.groups:
+			for tg in g:
+				if isinstance(tg, Task.TaskBase):
+					lst = [tg]
+				else:
+					lst = getattr(tg, 'tasks', [])
+				for tsk in lst:
+					if isinstance(tsk, Task.Task):
+						uids.add(tsk.uid())
+						for node in tsk.inputs + tsk.outputs + getattr(tsk, 'dep_nodes', []):
+							keep.add(id(node))
+
+		removed = set()
+		for x in SHARDED_ATTRS:
+			tbl = getattr(self, x)
+			for k in list(tbl.keys()):
+				uid = self.task_uid(k)
+				if uid is not None and not uid in uids:
+					del tbl[k]
+					removed.add(uid)
+		for v in self.node_deps.values():
+			if isinstance(v, waflib.Node.Node):
+				keep.add(id(v))
+			elif isinstance(v, (list, tuple)):
+				for node in v:
+					keep.add(id(node))
+
+		def prune(node):
+			# True if the node has to be kept
+			ret = id(node) in keep
+			ch = getattr(node, 'children', None)
+			if ch:
+				for (k, x) in list(ch.items()):
+					if not prune(x):
+						del ch[k]
+				if ch:
+					ret = True
+			return ret or os.path.exists(node.abspath())
+
+		def count_nodes(node):
+			return 1 + sum(count_nodes(x) for x in getattr(node, 'children', {}).values())
+
+		nodes = count_nodes(self.root)
+		prune(self.root)
+		nodes -= count_nodes(self.root)
+
+		for k in list(self.file_sigs.keys()):
+			if not os.path.isfile(k.abspath()):
+				del self.file_sigs[k]
+
+		self.journal_id = None
+		self.store()
+		Logs.info('Waf: removed the data of %d old tasks and %d nodes, %d bytes reclaimed' % (len(removed), nodes, size - db_size()))
+
 	def store(self):
 		"""
-		Store the data for next runs, sets the attributes listed in :py:const:`waflib.Build.SAVED_ATTRS`. Uses a temporary
-		file to avoid problems on ctrl+c.
+		Store the data for next runs, sets the attributes listed in :py:const:`waflib.Build.SAVED_ATTRS`.
+		The attributes listed in :py:const:`waflib.Build.SHARDED_ATTRS` are stored by :py:meth:`waflib.Build.BuildContext.store_shards`.
+
+		The entries changed since the data was loaded are appended to a journal by
+		:py:meth:`waflib.Build.BuildContext.store_journal`. A complete snapshot is written instead
+		when the journal exceeds :py:const:`waflib.Build.JOURNAL_RATIO` of its size, the journal
+		is then emptied. The snapshot uses a temporary file to avoid problems on ctrl+c.
 		"""
+		self.store_shards()
+
+		if self.journal_id and self.journal_size <= JOURNAL_RATIO * self.snapshot_size:
+			try:
+				self.store_journal()
+			except (IOError, OSError) as e:
+				Logs.debug('build: could not write the journal %r' % e)
+			else:
+				return
 
+		# a journal left over by a crash does not match the new identifier
+		journal_id = Utils.to_hex(Utils.h_list([time.time(), os.getpid(), id(self)]))
+
+		(tables, index) = waflib.Node.pack_tree(self.root)
+		head = {'hash_algo': Utils.hash_algo, 'journal_id': journal_id, 'nodes': tables}
 		data = {}
 		for x in SAVED_ATTRS:
-			data[x] = getattr(self, x)
+			if x != 'root' and not x in SHARDED_ATTRS:
+				data[x] = getattr(self, x)
 		db = os.path.join(self.variant_dir, Context.DBFILE)
 
-		try:
-			waflib.Node.pickle_lock.acquire()
-			waflib.Node.Nod3 = self.node_class
+		def node_id(obj):
+			if isinstance(obj, waflib.Node.Node):
+				try:
+					return index[id(obj)]
+				except KeyError:
+					# node removed from the tree
+					return waflib.Node.node_path(obj)
+			return None
 
-			f = None
-			try:
-				f = open(db + '.tmp', 'wb')
-				cPickle.dump(data, f)
-			finally:
-				if f:
-					f.close()
+		f = None
+		try:
+			f = open(db + '.tmp', 'wb')
+			cPickle.dump(head, f, -1)
+			p = cPickle.Pickler(f, -1)
+			p.persistent_id = node_id
+			p.dump(data)
 		finally:
-			waflib.Node.pickle_lock.release()
+			if f:
+				f.close()
 
 		try:
 			st = os.stat(db)
@@ -319,6 +894,75 @@ class BuildContext(Context.Context):
 
 		# do not use shutil.move (copy is not thread-safe)
 		os.rename(db + '.tmp', db)
+		self.snapshot_size = os.stat(db).st_size
+
+		# start a new journal for this snapshot
+		buf = BytesIO()
+		cPickle.dump({'journal_id': journal_id}, buf, -1)
+		payload = buf.getvalue()
+		f = open(db + '.log.tmp', 'wb')
+		try:
+			f.write(struct.pack('>II', len(payload), zlib.crc32(payload) & 0xffffffff) + payload)
+		finally:
+			f.close()
+		os.rename(db + '.log.tmp', db + '.log')
+
+		self.journal_id = journal_id
+		self.journal_size = len(payload) + 8
+		self.journal_base = dict((x, dict(getattr(self, x))) for x in JOURNAL_ATTRS)
+
+	def store_background(self):
+		"""
+		Store the build data from a forked process (``waf --background-store``) so that waf can exit without
+		waiting for the data to be written. The child process holds a lock on the file ``.wafpickle-N.lock``
+		until it is done, and :py:meth:`waflib.Build.BuildContext.restore` waits for the lock to be released
+		(see :py:meth:`waflib.Build.BuildContext.wait_store`). The data is stored at once if the process
+		cannot be forked.
+		"""
+		if not fcntl or not hasattr(os, 'fork'):
+			self.store()
+			return
+
+		fd = os.open(os.path.join(self.variant_dir, Context.DBFILE + '.lock'), os.O_RDWR | os.O_CREAT, 420) # 0644
+		try:
+			fcntl.flock(fd, fcntl.LOCK_EX)
+			sys.stdout.flush()
+			sys.stderr.flush()
+			pid = os.fork()
+		except (OSError, IOError):
+			os.close(fd)
+			self.store()
+			return
+
+		if pid:
+			# the lock remains held by the child process
+			os.close(fd)
+			return
+
+		ret = 0
+		try:
+			try:
+				self.store()
+			except Exception:
+				Logs.error('Could not store the build data in the background\n%s' % Utils.ex_stack())
+				ret = 1
+		finally:
+			os._exit(ret)
+
+	def wait_store(self):
+		"""
+		Wait until the build data written by :py:meth:`waflib.Build.BuildContext.store_background` is complete
+		"""
+		if not fcntl:
+			return
+		try:
+			fd = os.open(os.path.join(self.variant_dir, Context.DBFILE + '.lock'), os.O_RDWR)
+		except OSError:
+			return
+		try:
+			fcntl.flock(fd, fcntl.LOCK_EX)
+		finally:
+			os.close(fd)
 
 	def compile(self):
 		"""
@@ -338,8 +982,24 @@ class BuildContext(Context.Context):
 				self.store()
 			raise
 		else:
-			if self.producer.dirty:
-				self.store()
+			if self.producer.dirty or self.file_sigs_dirty:
+				t = time.time()
+				if Options.options.background_store:
+					self.store_background()
+				else:
+					self.store()
+				self.add_stat('store', time.time() - t)
+			elif Options.options.gc > 0:
+				# the unused entries age in the builds that do not change the build data too
+				t = time.time()
+				self.store_shards()
+				self.add_stat('store', time.time() - t)
+
+		if self.producer.max_load or self.producer.min_memory:
+			Logs.info('Waf: effective parallelism %.1f, throttled %d time(s)' % (self.producer.parallelism, self.producer.throttle_events))
+
+		if Logs.verbose and self.hash_count:
+			Logs.info('Waf: signatures of %d source files computed in %.3fs (%d files/s)' % (self.hash_count, self.hash_time, self.hash_count / max(self.hash_time, 1e-9)))
 
 		if self.producer.error:
 			raise Errors.BuildError(self.producer.error)
@@ -428,7 +1088,8 @@ class BuildContext(Context.Context):
 			if not env:
 				return Utils.SIG_NIL
 
-		idx = str(id(env)) + str(vars_lst)
+		# envs holding the same values share the cache entries
+		idx = (env.fingerprint(), tuple(vars_lst))
 		try:
 			cache = self.cache_env
 		except AttributeError:
@@ -703,6 +1364,283 @@ class BuildContext(Context.Context):
 					if tg.path.is_child_of(ln):
 						f()
 
+	def hash_tasks(self, tasks):
+		"""
+		Hash the source files used by the tasks (inputs, :py:attr:`waflib.Task.Task.dep_nodes` and the dependencies
+		found by the scanners during the previous build) on several threads, before the task signatures are computed
+		one at a time by the scheduler. The hashes are stored in ``hash_cache`` (see :py:meth:`waflib.Node.Node.get_bld_sig`).
+		The files from the build directory are not hashed, they may still have to be created.
+
+		:param tasks: tasks of the current group
+		:type tasks: list of :py:class:`waflib.Task.TaskBase`
+		"""
+		numjobs = Options.options.jobs
+		if numjobs < 2:
+			return
+
+		try:
+			cache = self.hash_cache
+		except AttributeError:
+			cache = self.hash_cache = {}
+
+		nodes = set([])
+		for tsk in tasks:
+			try:
+				nodes.update(tsk.inputs)
+				nodes.update(tsk.dep_nodes)
+				nodes.update(self.node_deps.get(tsk.uid(), []))
+			except AttributeError:
+				pass
+		lst = [x for x in nodes if not id(x) in cache and not x.is_bld()]
+		if not lst:
+			return
+
+		t = time.time()
+		count = len(lst)
+		def hash_nodes():
+			while 1:
+				try:
+					node = lst.pop()
+				except IndexError:
+					break
+				try:
+					node.get_bld_sig()
+				except Exception:
+					# the error is reported when the signature is needed
+					pass
+
+		threads = [Utils.threading.Thread(target=hash_nodes) for i in range(min(numjobs, count))]
+		for x in threads:
+			x.start()
+		for x in threads:
+			x.join()
+
+		t = time.time() - t
+		self.hash_time += t
+		self.hash_count += count
+		self.add_stat('hash_files', t, count)
+		Logs.debug('build: signatures of %d files computed in %.3fs (%d files/s)' % (count, t, count / max(t, 1e-9)))
+
+	def prescan(self, tasks):
+		"""
+		Scan the dependencies of the tasks in worker processes or threads (``waf --prescan``). The scanners
+		(:py:meth:`waflib.Task.Task.scan`) are otherwise called one at a time when the tasks are about to run,
+		and the consumers wait for them.
+
+		The tasks which inputs are ready compute their signatures first: the tasks reaching the scan step in
+		:py:meth:`waflib.Task.Task.sig_implicit_deps` are added to :py:attr:`waflib.Build.BuildContext.scan_queue`
+		instead of calling the scanner. The queue is then split between the workers, and the results are kept in the
+		attribute ``scan_results`` of the tasks until the tasks are executed. The scanners failing are called again
+		in the main process, where the errors are reported.
+
+		Forking is not safe once other threads are executing tasks, so the processes
+		(:py:meth:`waflib.Build.BuildContext.prescan_processes`) are used only before the consumer threads and the
+		process pool of :py:class:`waflib.Runner.Parallel` are created, usually for the first build group, and
+		if ``os.fork`` is available. The other groups are scanned by threads
+		(:py:meth:`waflib.Build.BuildContext.prescan_threads`).
+
+		:param tasks: tasks of the current build group
+		:type tasks: list of :py:class:`waflib.Task.TaskBase`
+		"""
+		t = time.time()
+		queue = self.scan_queue = []
+		try:
+			for tsk in tasks:
+				if tsk.hasrun or not getattr(tsk, 'scan', None):
+					continue
+				for x in tsk.run_after:
+					if not x.finished:
+						break
+				else:
+					try:
+						tsk.signature()
+					except Exception:
+						# scanned when the task is executed
+						pass
+		finally:
+			self.scan_queue = None
+
+		if hasattr(os, 'fork') and not hasattr(getattr(self, 'producer', None), 'pool'):
+			count = self.prescan_processes(queue)
+			kind = 'processes'
+		else:
+			count = self.prescan_threads(queue)
+			kind = 'threads'
+
+		t = time.time() - t
+		self.add_stat('prescan', t, count)
+		Logs.debug('build: %d tasks scanned by %s in %.3fs' % (count, kind, t))
+
+	def prescan_processes(self, queue):
+		"""
+		Split the tasks waiting for a scan between processes forked from the current process, see
+		:py:meth:`waflib.Build.BuildContext.prescan`. The scanners and their caches are used by one thread in each
+		process, and the results are returned through pipes, with the nodes given by path.
+
+		:param queue: tasks to scan
+		:type queue: list of :py:class:`waflib.Task.Task`
+		:return: amount of tasks scanned
+		:rtype: int
+		"""
+		numjobs = min(self.prescan_jobs, len(queue))
+		if numjobs < 2:
+			return 0
+
+		def node_path(obj):
+			if isinstance(obj, waflib.Node.Node):
+				return waflib.Node.node_path(obj)
+			return None
+
+		procs = []
+		for i in range(numjobs):
+			(rfd, wfd) = os.pipe()
+			pid = os.fork()
+			if not pid:
+				try:
+					os.close(rfd)
+					ret = []
+					for k in range(i, len(queue), numjobs):
+						try:
+							ret.append((k, queue[k].scan()))
+						except Exception:
+							pass
+					f = os.fdopen(wfd, 'wb')
+					try:
+						p = cPickle.Pickler(f, -1)
+						p.persistent_id = node_path
+						p.dump(ret)
+					finally:
+						f.close()
+				finally:
+					os._exit(0)
+			os.close(wfd)
+			procs.append((pid, rfd))
+
+		count = 0
+		for (pid, rfd) in procs:
+			f = os.fdopen(rfd, 'rb')
+			try:
+				u = cPickle.Unpickler(f)
+				u.persistent_load = self.root.make_node
+				ret = u.load()
+			except Exception as e:
+				Logs.debug('build: a scanner process failed: %r' % e)
+				ret = []
+			f.close()
+			os.waitpid(pid, 0)
+			for (k, v) in ret:
+				queue[k].scan_results = v
+			count += len(ret)
+
+		return count
+
+	def prescan_threads(self, queue):
+		"""
+		Split the tasks waiting for a scan between threads, see :py:meth:`waflib.Build.BuildContext.prescan`. Only the
+		scanners declared safe for concurrent use (attribute *thread_safe* set on the function, for example
+		:py:func:`waflib.Tools.c_preproc.scan`) are called, the other tasks are scanned when they are about to run.
+		The consumer threads may execute the tasks of the previous groups (``waf --pipeline``) in the meantime.
+
+		:param queue: tasks to scan
+		:type queue: list of :py:class:`waflib.Task.Task`
+		:return: amount of tasks scanned
+		:rtype: int
+		"""
+		queue = [x for x in queue if getattr(x.scan, 'thread_safe', False)]
+		numjobs = min(self.prescan_jobs, len(queue))
+		if numjobs < 2:
+			return 0
+
+		done = []
+		def work(i):
+			for k in range(i, len(queue), numjobs):
+				tsk = queue[k]
+				try:
+					tsk.scan_results = tsk.scan()
+				except Exception:
+					pass
+				else:
+					done.append(k)
+
+		threads = [Utils.threading.Thread(target=work, args=(i,)) for i in range(numjobs)]
+		for x in threads:
+			x.start()
+		for x in threads:
+			x.join()
+		return len(done)
+
+	def add_stat(self, name, duration, count=1):
+		"""
+		Add the time spent in a build phase to :py:attr:`waflib.Build.BuildContext.stats`, when the statistics
+		are enabled (``waf --stats``). The times of the phases executed by several threads at once
+		(task execution, file hashing) are summed, so they may exceed the wall time of the build.
+
+		:param name: build phase, usually from :py:const:`waflib.Build.STATS`
+		:type name: string
+		:param duration: time spent in seconds
+		:type duration: float
+		:param count: amount of calls or of items processed
+		:type count: int
+		"""
+		if self.stats is None:
+			return
+		self.stats_lock.acquire()
+		try:
+			try:
+				lst = self.stats[name]
+			except KeyError:
+				lst = self.stats[name] = [0, 0.]
+			lst[0] += count
+			lst[1] += duration
+		finally:
+			self.stats_lock.release()
+
+	def report_stats(self, total):
+		"""
+		Display the statistics collected by :py:meth:`waflib.Build.BuildContext.add_stat` as a table,
+		and write them to the JSON file given by ``waf --stats-json=FILE`` so that the times of
+		the builds can be compared over time::
+
+			{"command": "build", "total": 0.52, "tasks": 0, "phases": {"restore": {"count": 1, "time": 0.07}, ...}}
+
+		:param total: wall time of the build command in seconds
+		:type total: float
+		"""
+		if self.stats is None:
+			return
+
+		names = [x for x in STATS if x in self.stats]
+		names.extend(sorted(x for x in self.stats if not x in STATS))
+
+		lines = ['%-28s %10s %12s' % ('phase', 'count', 'time (s)')]
+		for x in names:
+			(count, t) = self.stats[x]
+			lines.append('%-28s %10d %12.3f' % (x, count, t))
+		lines.append('%-28s %10s %12.3f' % ('total', '', total))
+		Logs.info('\n'.join(lines))
+
+		path = Options.options.stats_json
+		if path:
+			data = {
+				'command': self.cmd,
+				'variant': self.variant,
+				'version': Context.WAFVERSION,
+				'jobs': Options.options.jobs,
+				'date': time.time(),
+				'total': total,
+				'tasks': len(getattr(self, 'returned_tasks', [])),
+				'phases': dict((x, {'count': self.stats[x][0], 'time': self.stats[x][1]}) for x in names),
+			}
+			path = os.path.join(Context.launch_dir, os.path.expanduser(path))
+			try:
+				f = open(path, 'w')
+				try:
+					json.dump(data, f, indent=1, sort_keys=True)
+				finally:
+					f.close()
+			except (IOError, OSError) as e:
+				Logs.error('Could not write the build statistics to %r: %s' % (path, e))
+
 	def get_tasks_group(self, idx):
 		"""
 		Return all the tasks for the group of num idx, used by :py:meth:`waflib.Build.BuildContext.get_build_iterator`
@@ -724,6 +1662,7 @@ class BuildContext(Context.Context):
 		:rtype: list of :py:class:`waflib.Task.TaskBase`
 		"""
 		self.cur = 0
+		self.cur_tasks = []
 
 		if self.targets and self.targets != '*':
 			(self._min_grp, self._exact_tg) = self.get_targets()
@@ -731,14 +1670,18 @@ class BuildContext(Context.Context):
 		global lazy_post
 		if self.post_mode != POST_LAZY:
 			while self.cur < len(self.groups):
+				t = time.time()
 				self.post_group()
+				self.add_stat('post_group', time.time() - t)
 				self.cur += 1
 			self.cur = 0
 
 		while self.cur < len(self.groups):
 			# first post the task generators for the group
 			if self.post_mode != POST_AT_ONCE:
+				t = time.time()
 				self.post_group()
+				self.add_stat('post_group', time.time() - t)
 
 			# then extract the tasks
 			tasks = self.get_tasks_group(self.cur)
@@ -748,13 +1691,28 @@ class BuildContext(Context.Context):
 			#
 			# if the tasks have only files, set_file_constraints is required but set_precedence_constraints is not necessary
 			#
+			t = time.time()
 			Task.set_file_constraints(tasks)
+			self.add_stat('set_file_constraints', time.time() - t)
+			t = time.time()
 			Task.set_precedence_constraints(tasks)
-
-			self.cur_tasks = tasks
+			self.add_stat('set_precedence_constraints', time.time() - t)
+
+			if self.pipeline:
+				# the tasks of the previous groups may be still waiting or running
+				pending = [x for x in self.cur_tasks if not x.finished]
+				if pending:
+					Task.set_pipeline_constraints(pending, tasks)
+				self.cur_tasks = pending + tasks
+			else:
+				self.cur_tasks = tasks
 			self.cur += 1
 			if not tasks: # return something else the build will stop
 				continue
+			self.load_shards(tasks)
+			self.hash_tasks(tasks)
+			if self.prescan_jobs > 1:
+				self.prescan(tasks)
 			yield tasks
 		while 1:
 			yield []
@@ -1138,17 +2096,26 @@ class CleanContext(BuildContext):
 		"""clean the data and some files in the build dir .. well, TODO"""
 		Logs.debug('build: clean called')
 
+		# the entries of all the folders are removed
+		for x in self.list_shards():
+			self.load_shard(x)
+
 		if self.bldnode != self.srcnode:
 			# would lead to a disaster if top == out
 			lst = [self.root.find_or_declare(f) for f in self.env[CFG_FILES]]
-			for n in self.bldnode.ant_glob('**/*', excl='lock* *conf_check_*/** config.log c4che/*'):
+			for n in self.bldnode.ant_glob('**/*', excl='lock* *conf_check_*/** config.log c4che/* %s.d/**' % Context.DBFILE):
 				if n in lst:
 					continue
 				n.delete()
 		self.root.children = {}
+		# the node tree changed, write a new snapshot
+		self.journal_id = None
 
-		for v in 'node_deps task_sigs raw_deps'.split():
+		# keep the task durations for the critical path scheduler (waf --order=critical)
+		times = dict((k, v) for (k, v) in self.task_sigs.items() if isinstance(k, tuple) and k[1] == 'time')
+		for v in 'node_deps task_sigs raw_deps file_sigs'.split():
 			setattr(self, v, {})
+		self.task_sigs.update(times)
 
 class ListContext(BuildContext):
 	'''lists the targets to execute'''
@@ -1187,6 +2154,31 @@ class ListContext(BuildContext):
 		for k in lst:
 			Logs.pprint('GREEN', k)
 
+class GcContext(BuildContext):
+	'''removes the build data of old tasks and files'''
+
+	cmd = 'gc'
+	def execute(self):
+		"""
+		See :py:func:`waflib.Context.Context.execute`.
+		"""
+		self.restore()
+		if not self.all_envs:
+			self.load_envs()
+
+		self.recurse([self.run_dir])
+		self.pre_build()
+
+		for g in self.groups:
+			for tg in g:
+				try:
+					f = tg.post
+				except AttributeError:
+					pass
+				else:
+					f()
+		self.gc()
+
 class StepContext(BuildContext):
 	'''executes tasks in a step-by-step fashion, for debugging'''
 	cmd = 'step'
@@ -26,7 +26,7 @@ class ConfigSet(object):
 		env.FOO = 'test'
 		env['FOO'] = 'test'
 	"""
-	__slots__ = ('table', 'parent')
+	__slots__ = ('table', 'parent', 'sig_cache')
 	def __init__(self, filename=None):
 		self.table = {}
 		"""
@@ -34,6 +34,11 @@ class ConfigSet(object):
 		"""
 		#self.parent = None
 
+		self.sig_cache = None
+		"""
+		Fingerprint of the parent and of the local values, see :py:meth:`ConfigSet.fingerprint`
+		"""
+
 		if filename:
 			self.load(filename)
 
@@ -81,12 +86,14 @@ class ConfigSet(object):
 		Dictionary interface: get value from key
 		"""
 		self.table[key] = value
+		self.sig_cache = None
 
 	def __delitem__(self, key, value):
 		"""
 		Dictionary interface: get value from key
 		"""
 		del self.table[key]
+		self.sig_cache = None
 
 	def __getattr__(self, name):
 		"""
@@ -162,6 +169,7 @@ class ConfigSet(object):
 			for x in keys:
 				tbl[x] = copy.deepcopy(tbl[x])
 			self.table = tbl
+			self.sig_cache = None
 
 	def get_flat(self, key):
 		"""
@@ -210,6 +218,7 @@ class ConfigSet(object):
 		if isinstance(val, str): # if there were string everywhere we could optimize this
 			val = [val]
 		current_value.extend(val)
+		self.sig_cache = None
 
 	def prepend_value(self, var, val):
 		"""
@@ -223,6 +232,7 @@ class ConfigSet(object):
 		if isinstance(val, str):
 			val = [val]
 		self.table[var] =  val + self._get_list_value_for_modification(var)
+		self.sig_cache = None
 
 	def append_unique(self, var, val):
 		"""
@@ -240,6 +250,7 @@ class ConfigSet(object):
 		for x in val:
 			if x not in current_value:
 				current_value.append(x)
+		self.sig_cache = None
 
 	def get_merged_dict(self):
 		"""
@@ -290,6 +301,7 @@ class ConfigSet(object):
 		for m in re_imp.finditer(code):
 			g = m.group
 			tbl[g(2)] = eval(g(3))
+		self.sig_cache = None
 		Logs.debug('env: %s' % str(self.table))
 
 	def update(self, d):
@@ -324,4 +336,43 @@ class ConfigSet(object):
 		Reverts the object to a previous state. See :py:meth:`ConfigSet.stash`
 		"""
 		self.table = self.undo_stack.pop(-1)
+		self.sig_cache = None
+
+	def fingerprint(self):
+		"""
+		Compute a fingerprint of the values reachable from this object (local values and parents).
+		Objects holding the same values have the same fingerprint, which is used by
+		:py:meth:`waflib.Build.BuildContext.hash_env_vars` to share the hashes between the tasks.
+
+		The local part is computed once and kept until a value is set through the
+		:py:class:`ConfigSet` methods (``env.FOO = x``, :py:meth:`ConfigSet.append_value`,
+		:py:meth:`ConfigSet.prepend_value`, :py:meth:`ConfigSet.append_unique`...). The parents
+		return their own cached values, so only the objects modified since the last call are hashed again.
+
+		Modifying the lists in place (``env.CFLAGS.append(x)``) after the first call is not supported
+		as the change is not detected; in verbose mode (``waf -v``) the cached value is verified
+		and a warning is displayed.
+
+		:rtype: hash value
+		"""
+		try:
+			parent = self.parent
+		except AttributeError:
+			psig = None
+		else:
+			psig = parent.fingerprint()
+
+		cache = getattr(self, 'sig_cache', None)
+		if cache and cache[0] == psig:
+			if not Logs.verbose:
+				return cache[1]
+
+		keys = list(self.table.keys())
+		keys.sort()
+		tbl = self.table
+		ret = Utils.h_list([psig, [(x, tbl[x]) for x in keys]])
+		if cache and cache[0] == psig and cache[1] != ret:
+			Logs.warn('env: values were modified in place, use the ConfigSet methods to change them')
+		self.sig_cache = (psig, ret)
+		return ret
 
@@ -200,6 +200,12 @@ class ConfigurationContext(Context.Context):
 		abi = Context.ABI
 		self.to_log(conf_template % vars())
 
+		self.hash_type = [Options.options.hash, Options.options.hash_size]
+		try:
+			Utils.set_hash(*self.hash_type)
+		except Errors.WafError as e:
+			self.fatal(str(e))
+
 		self.msg('Setting top to', self.srcnode.abspath())
 		self.msg('Setting out to', self.bldnode.abspath())
 
@@ -254,7 +260,7 @@ class ConfigurationContext(Context.Context):
 	def store(self):
 		"""Save the config results into the cache file"""
 		n = self.cachedir.make_node('build.config.py')
-		n.write('version = 0x%x\ntools = %r\n' % (Context.HEXVERSION, self.tools))
+		n.write('version = 0x%x\ntools = %r\nhash_type = %r\n' % (Context.HEXVERSION, self.tools, self.hash_type))
 
 		if not self.all_envs:
 			self.fatal('nothing to store in the configuration context!')
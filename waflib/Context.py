@@ -23,7 +23,7 @@ WAFVERSION="1.6.1"
 WAFREVISION="10307"
 """Constant updated on new releases"""
 
-ABI = 98
+ABI = 99
 """Version of the build data cache file format (used in :py:const:`waflib.Context.DBFILE`)"""
 
 DBFILE = '.wafpickle-%d' % ABI
@@ -306,6 +306,9 @@ class Context(ctx):
 		"""
 		subprocess = Utils.subprocess
 		kw['shell'] = isinstance(cmd, str)
+		if not 'close_fds' in kw and 'jobserver' in os.environ.get('MAKEFLAGS', ''):
+			# keep the jobserver file descriptors open for sub-makes (see waflib.Runner.get_jobserver)
+			kw['close_fds'] = False
 		Logs.debug('runner: %r' % cmd)
 		Logs.debug('runner_env: kw=%s' % kw)
 
@@ -348,6 +351,9 @@ class Context(ctx):
 		"""
 		subprocess = Utils.subprocess
 		kw['shell'] = isinstance(cmd, str)
+		if not 'close_fds' in kw and 'jobserver' in os.environ.get('MAKEFLAGS', ''):
+			# keep the jobserver file descriptors open for sub-makes (see waflib.Runner.get_jobserver)
+			kw['close_fds'] = False
 		Logs.debug('runner: %r' % cmd)
 
 		if 'quiet' in kw:
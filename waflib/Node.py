@@ -20,7 +20,7 @@ Node: filesystem structure, contains lists of nodes
    (:py:class:`waflib.Node.Nod3`, see the :py:class:`waflib.Context.Context` initializer). A reference to the context owning a node is held as self.ctx
 """
 
-import os, re, sys, shutil
+import os, re, sys, shutil, time, bisect
 from waflib import Utils, Errors
 
 exclude_regs = '''
@@ -58,6 +58,12 @@ Ant patterns for files and folders to exclude while doing the
 recursive traversal in :py:meth:`waflib.Node.Node.ant_glob`
 """
 
+RACY_DELAY = 2
+"""
+Files modified less than this amount of seconds before being hashed are hashed again on the next build,
+as the timestamps may not reveal a change made in the meantime (see :py:meth:`waflib.Node.Node.h_file`)
+"""
+
 # TODO optimize split_path by performing a replacement when unpacking?
 
 def split_path(path):
@@ -808,14 +814,278 @@ class Node(object):
 		else:
 			return ret
 
-		if not self.is_bld() or self.ctx.bldnode is self.ctx.srcnode:
-			self.sig = Utils.h_file(self.abspath())
+		if getattr(self.ctx, 'stats', None) is not None:
+			t = time.time()
+			if not self.is_bld() or self.ctx.bldnode is self.ctx.srcnode:
+				self.sig = self.h_file()
+			self.ctx.add_stat('hash_cache_miss', time.time() - t)
+		elif not self.is_bld() or self.ctx.bldnode is self.ctx.srcnode:
+			self.sig = self.h_file()
 		self.ctx.hash_cache[id(self)] = ret = self.sig
 		return ret
 
+	def h_file(self):
+		"""
+		Hash the file contents with :py:func:`waflib.Utils.h_file`. The hash stored in the build data
+		(:py:attr:`waflib.Build.BuildContext.file_sigs`) is reused if the file status (inode, size and timestamps)
+		did not change since it was computed. A file modified less than :py:const:`waflib.Node.RACY_DELAY`
+		seconds before being hashed may have changed again without a new timestamp, so it is hashed again.
+
+		:rtype: hash value
+		"""
+		path = self.abspath()
+		try:
+			cache = self.ctx.file_sigs
+		except AttributeError:
+			return Utils.h_file(path)
+
+		st = os.stat(path)
+		key = (st.st_ino, st.st_size, getattr(st, 'st_mtime_ns', st.st_mtime), getattr(st, 'st_ctime_ns', st.st_ctime))
+		try:
+			(old_key, old, t) = cache[self]
+		except KeyError:
+			old_key = old = None
+		else:
+			if old_key == key and st.st_mtime < t - RACY_DELAY:
+				return old
+
+		t = time.time()
+		ret = Utils.h_file(path)
+		if old_key == key and old == ret and st.st_mtime >= t - RACY_DELAY:
+			# still in the racy window, a new entry would be written to the build data for nothing
+			return ret
+		cache[self] = (key, ret, t)
+		self.ctx.file_sigs_dirty = True
+		return ret
+
 pickle_lock = Utils.threading.Lock()
 """Lock mandatory for thread-safe node serialization"""
 
+def pack_tree(root):
+	"""
+	Flatten a node tree for the serialization of the build data: the nodes are listed parents first,
+	and each node is described by the position of its parent, the position of its name in a list of
+	unique names, and its signature. This is much more compact than pickling the nodes and the
+	class swap (:py:class:`waflib.Node.Nod3`) is not needed. The children of the folders restored by
+	:py:func:`waflib.Node.unpack_tree` and never accessed are copied from the previous tables.
+
+	:param root: root node
+	:type root: :py:class:`waflib.Node.Node`
+	:return: a tuple (tables, index) where index maps the ids of the nodes to their positions
+	"""
+	strings = []
+	seen = {}
+	names = []
+	parents = []
+	sigs = []
+	empty = []
+	index = {id(root): 0}
+
+	# nodes, or tuples (tree, position) for the nodes that were not created
+	nodes = [root]
+	parent_idx = [-1]
+	i = 0
+	while i < len(nodes):
+		node = nodes[i]
+		if node.__class__ is tuple:
+			(tree, pos) = node
+			name = tree.strings[tree.names[pos]]
+			sig = tree.sigs[pos]
+		else:
+			name = node.name
+			sig = getattr(node, 'sig', None)
+			tree = getattr(node, 'packed_tree', None)
+			pos = tree and tree.pending(node)
+
+		if pos is None:
+			children = getattr(node, 'children', None)
+			if children is not None:
+				if not children:
+					empty.append(i)
+				for x in children.values():
+					index[id(x)] = len(nodes)
+					nodes.append(x)
+					parent_idx.append(i)
+		elif tree.has_children(pos):
+			(lo, hi) = tree.span(pos)
+			if lo == hi:
+				empty.append(i)
+			for x in range(lo, hi):
+				nodes.append((tree, x))
+				parent_idx.append(i)
+
+		try:
+			names.append(seen[name])
+		except KeyError:
+			seen[name] = len(strings)
+			names.append(len(strings))
+			strings.append(name)
+		parents.append(parent_idx[i])
+		sigs.append(sig)
+		i += 1
+	return ((strings, names, parents, sigs, empty), index)
+
+def unpack_tree(cls, tables):
+	"""
+	Re-create the root of the node tree flattened by :py:func:`waflib.Node.pack_tree`. The other nodes are
+	created when the children of their parent are accessed, so that the folders not used by a build are
+	never created, see :py:class:`waflib.Node.PackedTree`.
+
+	:param cls: node class of the build context
+	:type cls: :py:class:`waflib.Node.Node` subclass
+	:param tables: tables returned by :py:func:`waflib.Node.pack_tree`
+	:type tables: tuple
+	:rtype: :py:class:`waflib.Node.PackedTree`
+	"""
+	return PackedTree(cls, tables)
+
+class PackedTree(object):
+	"""
+	Nodes restored from the tables of :py:func:`waflib.Node.pack_tree`. The folders are created with a
+	subclass of the node class which creates their children on first access to the attribute *children*,
+	the folders are then changed to the node class. The tables are lists of integers, so the memory and the time
+	spent on the folders that are not used is small.
+	"""
+	def __init__(self, cls, tables):
+		(self.strings, self.names, self.parents, self.sigs, empty) = tables
+		self.empty = set(empty)
+		self.cls = cls
+		self.lock = Utils.threading.Lock()
+
+		self.pos = {}
+		"""Positions of the folders whose children were not created yet"""
+
+		self.nodes = [None] * len(self.names)
+		"""Nodes created, by position"""
+
+		tree = self
+		class lazy(cls):
+			packed_tree = tree
+			def __getattr__(self, name):
+				if name == 'children':
+					return tree.expand(self)
+				raise AttributeError(name)
+		lazy.__name__ = cls.__name__
+		lazy.__module__ = cls.__module__
+		self.lazy = lazy
+
+		self.root = self.create(0, None)
+
+	def __getitem__(self, pos):
+		"""
+		Obtain the node at a given position, creating its parent folders if necessary
+
+		:param pos: position in the tables
+		:type pos: int
+		:rtype: :py:class:`waflib.Node.Node`
+		"""
+		node = self.nodes[pos]
+		if node is None:
+			self[self.parents[pos]].children
+			node = self.nodes[pos]
+		return node
+
+	def span(self, pos):
+		"""
+		The children of a node are listed together, and the nodes are listed parents first
+
+		:return: range of positions of the children of a node
+		:rtype: tuple
+		"""
+		parents = self.parents
+		lo = bisect.bisect_left(parents, pos, pos + 1)
+		return (lo, bisect.bisect_right(parents, pos, lo))
+
+	def has_children(self, pos):
+		"""
+		:return: True if the node at this position has a dict of children (a folder that was listed or used)
+		:rtype: bool
+		"""
+		if pos in self.empty:
+			return True
+		parents = self.parents
+		lo = bisect.bisect_left(parents, pos, pos + 1)
+		return lo < len(parents) and parents[lo] == pos
+
+	def create(self, pos, parent):
+		"""
+		Create the node at a given position, its children are not created
+
+		:rtype: :py:class:`waflib.Node.Node`
+		"""
+		if pos in self.empty:
+			node = object.__new__(self.cls)
+			node.children = {}
+		elif self.has_children(pos):
+			node = object.__new__(self.lazy)
+			self.pos[node] = pos
+		else:
+			node = object.__new__(self.cls)
+		node.name = self.strings[self.names[pos]]
+		node.parent = parent
+		sig = self.sigs[pos]
+		if sig is not None:
+			node.sig = sig
+		self.nodes[pos] = node
+		return node
+
+	def expand(self, node):
+		"""
+		Create the children of a folder, called when the attribute *children* is accessed (may be called by the
+		consumer threads)
+
+		:return: the children of the node
+		:rtype: dict
+		"""
+		self.lock.acquire()
+		try:
+			try:
+				pos = self.pos.pop(node)
+			except KeyError:
+				# created by another thread
+				return node.children
+			(lo, hi) = self.span(pos)
+			d = {}
+			for x in range(lo, hi):
+				child = self.create(x, node)
+				d[child.name] = child
+			node.children = d
+			node.__class__ = self.cls
+			return d
+		finally:
+			self.lock.release()
+
+	def pending(self, node):
+		"""
+		:return: the position of a folder whose children were not created, or None
+		:rtype: int or None
+		"""
+		try:
+			pos = self.pos[node]
+		except KeyError:
+			return None
+		try:
+			Node.children.__get__(node, Node)
+		except AttributeError:
+			return pos
+		# the children were set directly
+		del self.pos[node]
+		node.__class__ = self.cls
+		return None
+
+def node_path(node):
+	"""
+	Names of the nodes from the root to a node, used for storing references to nodes (see :py:func:`waflib.Node.Node.make_node`)
+
+	:rtype: list of string
+	"""
+	lst = []
+	while node.parent:
+		lst.append(node.name)
+		node = node.parent
+	lst.reverse()
+	return lst
+
 class Nod3(Node):
 	"""Mandatory subclass for thread-safe node serialization"""
 	pass # do not remove
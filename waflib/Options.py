@@ -55,6 +55,8 @@ class opt_parser(optparse.OptionParser):
 		jobs = ctx.jobs()
 		p('-j', '--jobs',     dest='jobs',    default=jobs, type='int', help='amount of parallel jobs (%r)' % jobs)
 		p('-k', '--keep',     dest='keep',    default=False, action='store_true', help='keep running happily on independent task groups')
+		p('-l', '--load',     dest='load',    default=0,     type='float', help='do not start new tasks while the load average is above this value')
+		p('--min-memory',     dest='min_memory', default=0,  type='int', help='do not start new tasks while the available memory is below this value (MB)')
 		p('-v', '--verbose',  dest='verbose', default=0,     action='count', help='verbosity level -v -vv or -vvv [default: 0]')
 		p('--nocache',        dest='nocache', default=False, action='store_true', help='ignore the WAFCACHE (if set)')
 		p('--zones',          dest='zones',   default='',    action='store', help='debugging zones (task_gen, deps, tasks, etc)')
@@ -75,6 +77,10 @@ class opt_parser(optparse.OptionParser):
 				default_prefix = '/usr/local/'
 		gr.add_option('--prefix', dest='prefix', default=default_prefix, help='installation prefix [default: %r]' % default_prefix)
 		gr.add_option('--download', dest='download', default=False, action='store_true', help='try to download the tools if missing')
+		gr.add_option('--hash', dest='hash', default='md5', action='store', type='choice', choices=['md5', 'sha1', 'blake2b'],
+			help='hash algorithm for the signatures [default: md5]')
+		gr.add_option('--hash-size', dest='hash_size', default=0, action='store', type='int',
+			help='digest size in bytes for --hash=blake2b [default: 32]')
 
 
 		gr = optparse.OptionGroup(self, 'build and install options')
@@ -82,6 +88,32 @@ class opt_parser(optparse.OptionParser):
 
 		gr.add_option('-p', '--progress', dest='progress_bar', default=0, action='count', help= '-p: progress bar; -pp: ide output')
 		gr.add_option('--targets',        dest='targets', default='', action='store', help='task generators, e.g. "target1,target2"')
+		gr.add_option('--pools',          dest='pools', default='', action='store',
+			help='resource pools limiting the tasks executed at once, e.g. "link=2,memory_gb=64"')
+		gr.add_option('--jobserver',      dest='jobserver', default=False, action='store_true',
+			help='share the jobs with the processes started by the tasks (GNU make jobserver in MAKEFLAGS)')
+		gr.add_option('--executor',       dest='executor', default='threads', action='store', type='choice', choices=['threads', 'asyncio'],
+			help='execute the commands from threads or from an asyncio event loop (python >= 3.8) [default: threads]')
+		gr.add_option('--process-pool',   dest='process_pool', default=False, action='store_true',
+			help='execute the python tasks which allow it in worker processes')
+		gr.add_option('--rehash',         dest='rehash', default=False, action='store_true',
+			help='hash all the source files again instead of trusting their status (size, timestamps)')
+		gr.add_option('--restat',         dest='restat', default=False, action='store_true',
+			help='skip the tasks whose inputs were rebuilt with the same contents (hash the outputs)')
+		gr.add_option('--background-store', dest='background_store', default=False, action='store_true',
+			help='write the build data from a background process and exit at once')
+		gr.add_option('--prescan',        dest='prescan', default=False, action='store_true',
+			help='scan the dependencies of the tasks in worker processes (first build group) or threads before executing them')
+		gr.add_option('--stats',          dest='stats', default=False, action='store_true',
+			help='display the time spent in each build phase')
+		gr.add_option('--stats-json',     dest='stats_json', default='', action='store',
+			help='write the time spent in each build phase to a JSON file, e.g. "--stats-json=stats.json"')
+		gr.add_option('--gc',             dest='gc', default=0, action='store', type='int',
+			help='remove the build data of the tasks unused in the last N complete builds [default: 0, never]')
+		gr.add_option('--pipeline',       dest='pipeline', default=False, action='store_true',
+			help='start the tasks of the next build groups before the current group is complete')
+		gr.add_option('--order',          dest='order', default='fifo', action='store', type='choice', choices=['fifo', 'critical'],
+			help='task execution order: fifo or critical (longest chains of tasks first) [default: fifo]')
 
 		gr = optparse.OptionGroup(self, 'step options')
 		self.add_option_group(gr)
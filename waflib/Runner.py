@@ -7,12 +7,20 @@ Runner.py: Task scheduling and execution
 
 """
 
-import os, sys, random
+import os, sys, re, random, heapq, time, select, errno
 try:
 	from queue import Queue
 except:
 	from Queue import Queue
-from waflib import Utils, Logs, Task, Errors
+try:
+	import asyncio
+except ImportError:
+	asyncio = None
+try:
+	import multiprocessing
+except ImportError:
+	multiprocessing = None
+from waflib import Utils, Logs, Task, Errors, Options
 
 GAP = 10
 """
@@ -24,18 +32,357 @@ MAXJOBS = 999
 Maximum amount of jobs - cpython cannot really spawn more than 100 without crashing
 """
 
+TASK_COST = 0.01
+"""
+Estimated duration in seconds of a task, used by :py:func:`waflib.Runner.task_cost`
+for tasks that were never executed before and for which no similar task has a recorded duration
+"""
+
+INPUT_COST = 1e-6
+"""Estimated duration in seconds per byte of input, added to :py:const:`waflib.Runner.TASK_COST`"""
+
+ASYNC_THREADS = 4
+"""Amount of threads executing the python tasks when the asyncio executor is used, see :py:class:`waflib.Runner.AsyncConsumer`"""
+
+THROTTLE_INTERVAL = 0.5
+"""Minimum interval in seconds between two readings of the system load and of the available memory"""
+
+def get_load():
+	"""
+	:return: the system load average over the last minute, or 0 if it cannot be obtained
+	:rtype: float
+	"""
+	try:
+		return os.getloadavg()[0]
+	except (AttributeError, OSError):
+		return 0.
+
+def get_memory():
+	"""
+	:return: the available memory in MB read from ``/proc/meminfo``, or None if it cannot be obtained
+	:rtype: float
+	"""
+	try:
+		txt = Utils.readf('/proc/meminfo')
+	except (IOError, OSError):
+		return None
+	for line in txt.splitlines():
+		if line.startswith('MemAvailable:'):
+			try:
+				return int(line.split()[1]) / 1024.
+			except (IndexError, ValueError):
+				return None
+	return None
+
+re_jobserver = re.compile(r'--jobserver-(?:auth|fds)=(?:fifo:(\S+)|(\d+),(\d+))')
+"""Regexp matching the jobserver parameters in ``MAKEFLAGS``"""
+
+class JobServer(object):
+	"""
+	Token pool shared with GNU make and the other processes of the same build (jobserver protocol).
+	Each process owns one implicit token, and must read one byte from the jobserver pipe for each
+	additional job, writing the same byte back when the job is complete.
+	"""
+	def __init__(self, rfd, wfd, owner=False, opened=()):
+		self.wfd = wfd
+		self.owner = owner
+		"""True if the pipe was created by this process (see :py:func:`waflib.Runner.get_jobserver`)"""
+		self.implicit = True
+		"""True if the implicit token is available"""
+		self.opened = list(opened)
+		"""Descriptors opened by this process, closed by :py:meth:`waflib.Runner.JobServer.close`"""
+
+		self.pipe_rfd = rfd
+		self.rfd = open_nonblocking(rfd)
+		"""Non-blocking descriptor for reading the tokens, see :py:func:`waflib.Runner.open_nonblocking`"""
+		if self.rfd != rfd:
+			self.opened.append(self.rfd)
+
+	def acquire(self):
+		"""
+		Obtain a token, waiting until one is available
+
+		:return: the token read, or None for the implicit token
+		"""
+		while 1:
+			if self.implicit:
+				self.implicit = False
+				return None
+			# the implicit token may be released in the meantime
+			(r, w, e) = select.select([self.rfd], [], [], 0.1)
+			if r:
+				try:
+					token = os.read(self.rfd, 1)
+				except OSError as e:
+					# another process may have taken the token first
+					if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+						raise
+				else:
+					if token:
+						return token
+
+	def release(self, token):
+		"""
+		Give back a token obtained from :py:meth:`waflib.Runner.JobServer.acquire`, executed from the consumer threads
+		"""
+		if token is None:
+			self.implicit = True
+		else:
+			os.write(self.wfd, token)
+
+	def close(self):
+		"""Close the descriptors opened by this process and the pipe if this process created it, and restore ``MAKEFLAGS``"""
+		for x in self.opened:
+			os.close(x)
+		self.opened = []
+		if self.owner:
+			os.close(self.pipe_rfd)
+			os.close(self.wfd)
+			if self.makeflags is None:
+				del os.environ['MAKEFLAGS']
+			else:
+				os.environ['MAKEFLAGS'] = self.makeflags
+
+def open_nonblocking(fd):
+	"""
+	Obtain a non-blocking descriptor for reading the tokens of a jobserver: a token seen by ``select`` may be read
+	by another process first, and a blocking read would stop the scheduler. The pipe is opened again through
+	``/proc`` when possible, as setting O_NONBLOCK on a descriptor shared with GNU make affects it too.
+
+	:param fd: descriptor of the jobserver pipe or fifo
+	:type fd: int
+	:return: *fd*, or a new descriptor to close when the build ends
+	:rtype: int
+	"""
+	import fcntl
+	flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+	if flags & os.O_NONBLOCK:
+		return fd
+	try:
+		return os.open('/proc/self/fd/%d' % fd, os.O_RDONLY | os.O_NONBLOCK)
+	except OSError:
+		fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+		return fd
+
+def get_jobserver(numjobs, create=False):
+	"""
+	Connect to the jobserver of a parent process (GNU make or waf) from the file descriptors or
+	from the fifo given in ``MAKEFLAGS``. If there is no jobserver and *create* is set, create a new one
+	providing *numjobs* tokens, and export it in ``MAKEFLAGS`` for the processes executed by the tasks.
+
+	:param numjobs: amount of tokens, including the implicit token
+	:type numjobs: int
+	:param create: create a jobserver if necessary
+	:type create: bool
+	:rtype: :py:class:`waflib.Runner.JobServer` or None
+	"""
+	if Utils.is_win32:
+		return None
+
+	m = re_jobserver.search(os.environ.get('MAKEFLAGS', ''))
+	if m:
+		try:
+			if m.group(1):
+				# opened by this process only, so O_NONBLOCK may be set
+				rfd = wfd = os.open(m.group(1), os.O_RDWR | os.O_NONBLOCK)
+				opened = [rfd]
+			else:
+				rfd = int(m.group(2))
+				wfd = int(m.group(3))
+				os.fstat(rfd)
+				os.fstat(wfd)
+				opened = []
+		except OSError:
+			# for example, the rule in the makefile is not marked with '+'
+			Logs.debug('runner: the jobserver in MAKEFLAGS is not accessible')
+			return None
+		Logs.debug('runner: using the jobserver from MAKEFLAGS')
+		return JobServer(rfd, wfd, opened=opened)
+
+	if not create:
+		return None
+
+	(rfd, wfd) = os.pipe()
+	for x in (rfd, wfd):
+		try:
+			os.set_inheritable(x, True)
+		except AttributeError:
+			# python < 3.4, the descriptors are inheritable by default
+			pass
+	os.write(wfd, '+'.encode() * (numjobs - 1))
+
+	ret = JobServer(rfd, wfd, owner=True)
+	ret.makeflags = os.environ.get('MAKEFLAGS', None)
+	os.environ['MAKEFLAGS'] = '%s -j%d --jobserver-fds=%d,%d --jobserver-auth=%d,%d' % (ret.makeflags or '', numjobs, rfd, wfd, rfd, wfd)
+	Logs.debug('runner: jobserver created with %d tokens' % numjobs)
+	return ret
+
+def run_pool_fun(fun, args, hash_algo):
+	"""
+	Executed in the worker processes of :py:meth:`waflib.Runner.Parallel.run_in_process`: call the function
+	:py:attr:`waflib.Task.TaskBase.pool_fun` of a task and compute the signatures of the outputs
+
+	:param hash_algo: hash algorithm of the build (:py:attr:`waflib.Utils.hash_algo`), which is not inherited
+		by the worker processes when they are not forked
+	:return: a tuple (value returned, list of output signatures)
+	"""
+	if Utils.hash_algo != hash_algo:
+		if hash_algo.startswith('blake2b-'):
+			Utils.set_hash('blake2b', int(hash_algo[8:]))
+		else:
+			Utils.set_hash(hash_algo)
+	ret = fun(args)
+	sigs = []
+	for x in args.get('outputs', []):
+		try:
+			sigs.append(Utils.h_file(x))
+		except (IOError, OSError):
+			# a missing output is reported by post_run
+			sigs.append(None)
+	return (ret, sigs)
+
+def task_cost(tsk, averages):
+	"""
+	Estimate the execution time of a task for the critical path scheduler (``waf --order=critical``).
+	The wall-clock time recorded by a previous build is used when available, then the average
+	duration of the tasks of the same class, and finally an estimate based on the input file sizes.
+
+	:param tsk: task
+	:type tsk: :py:class:`waflib.Task.TaskBase`
+	:param averages: average duration of the tasks, by class name
+	:type averages: dict
+	:return: estimated duration in seconds
+	:rtype: float
+	"""
+	try:
+		return tsk.generator.bld.task_sigs[(tsk.uid(), 'time')]
+	except (AttributeError, KeyError):
+		pass
+	try:
+		return averages[tsk.__class__.__name__]
+	except KeyError:
+		pass
+	size = 0
+	for x in getattr(tsk, 'inputs', []):
+		try:
+			size += os.stat(x.abspath()).st_size
+		except OSError:
+			pass
+	return TASK_COST + INPUT_COST * size
+
+def set_critical_path(tasks):
+	"""
+	Compute the attribute ``prio_order`` on the tasks given, it represents the estimated duration
+	of the longest chain of tasks starting from the task (the task itself included).
+	Only the constraints between the tasks given (:py:attr:`waflib.Task.Task.run_after`) are considered.
+
+	:param tasks: tasks
+	:type tasks: list of :py:class:`waflib.Task.TaskBase`
+	"""
+	sums = Utils.defaultdict(float)
+	nums = Utils.defaultdict(int)
+	costs = {}
+	for x in tasks:
+		try:
+			t = x.generator.bld.task_sigs[(x.uid(), 'time')]
+		except (AttributeError, KeyError):
+			continue
+		name = x.__class__.__name__
+		sums[name] += t
+		nums[name] += 1
+	averages = dict((k, sums[k] / nums[k]) for k in sums)
+
+	revdeps = Utils.defaultdict(list)
+	for x in tasks:
+		costs[x] = task_cost(x, averages)
+		for k in getattr(x, 'run_after', ()):
+			revdeps[k].append(x)
+
+	# depth-first traversal without recursion, the chains of tasks may be very long
+	for x in tasks:
+		if getattr(x, 'prio_order', None) is not None:
+			continue
+		stack = [x]
+		while stack:
+			cur = stack[-1]
+			pending = [k for k in revdeps.get(cur, ()) if k in costs and getattr(k, 'prio_order', None) is None]
+			if pending and not getattr(cur, 'prio_visited', False):
+				cur.prio_visited = True
+				stack.extend(pending)
+				continue
+			stack.pop()
+			if getattr(cur, 'prio_order', None) is not None:
+				continue
+			prio = 0.
+			for k in revdeps.get(cur, ()):
+				if k in costs:
+					# the value is missing only on dependency cycles (deadlock detected later)
+					prio = max(prio, getattr(k, 'prio_order', None) or 0.)
+			cur.prio_order = costs[cur] + prio
+
+class PriorityTasks(object):
+	"""
+	Heap of tasks ready to be executed (:py:attr:`waflib.Runner.Parallel.outstanding`). The tasks with the
+	highest ``prio_order`` value are returned first (critical path scheduler), and tasks of equal priority
+	are returned in the order in which they were added.
+	"""
+	def __init__(self):
+		self.lst = []
+		self.idx = 0
+
+	def __len__(self):
+		return len(self.lst)
+
+	def __iter__(self):
+		for x in self.lst:
+			yield x[2]
+
+	def append(self, tsk):
+		"""Add a task"""
+		self.idx += 1
+		heapq.heappush(self.lst, (-getattr(tsk, 'prio_order', 0.), self.idx, tsk))
+
+	def insert(self, idx, tsk):
+		"""Add a task before the tasks of equal priority, provided for compatibility with lists"""
+		self.idx += 1
+		heapq.heappush(self.lst, (-getattr(tsk, 'prio_order', 0.), -self.idx, tsk))
+
+	def extend(self, lst):
+		"""Add several tasks"""
+		for x in lst:
+			self.append(x)
+
+	def __iadd__(self, lst):
+		self.extend(lst)
+		return self
+
+	def pop(self, idx=0):
+		"""Remove and return the task having the highest priority"""
+		return heapq.heappop(self.lst)[2]
+
 class TaskConsumer(Utils.threading.Thread):
 	"""
 	Task consumers belong to a pool of workers
 
-	They wait for tasks in the queue and then use ``task.process(...)``
+	They wait for tasks in the queue and then use ``task.process(...)``.
+	The queue is shared by all the consumers of a :py:class:`waflib.Runner.Parallel` instance,
+	so that no consumer remains idle while tasks are ready to be executed.
+	Functions put in the queue are called with the consumer as argument (to change the queue, for example).
 	"""
 	def __init__(self):
 		Utils.threading.Thread.__init__(self)
 		self.ready = Queue()
+		self.reset()
 		self.setDaemon(1)
 		self.start()
 
+	def reset(self):
+		"""Reset the utilisation counters"""
+		self.tasks = 0
+		"""Amount of tasks processed"""
+		self.busy = 0.
+		"""Time spent processing the tasks, in seconds"""
+
 	def run(self):
 		try:
 			self.loop()
@@ -45,7 +392,27 @@ class TaskConsumer(Utils.threading.Thread):
 	def loop(self):
 		while 1:
 			tsk = self.ready.get()
+			if not isinstance(tsk, Task.TaskBase):
+				tsk(self)
+			else:
+				self.execute(tsk)
+
+	def execute(self, tsk):
+		"""
+		Execute a task and give back its jobserver token, if any
+
+		:param tsk: task
+		:type tsk: :py:class:`waflib.Task.TaskBase`
+		"""
+		t = time.time()
+		try:
 			tsk.process()
+		finally:
+			# the task is complete, give back the jobserver token if any
+			if tsk.master.jobserver:
+				tsk.master.jobserver.release(tsk.jobserver_token)
+		self.busy += time.time() - t
+		self.tasks += 1
 
 pool = Queue()
 def get_pool():
@@ -57,6 +424,211 @@ def get_pool():
 def put_pool(x):
 	pool.put(x)
 
+class AsyncQueue(Queue):
+	"""
+	Queue of the tasks to execute, waking up the event loop of a :py:class:`waflib.Runner.AsyncConsumer`
+	each time an object is added
+	"""
+	def __init__(self, loop, callback):
+		Queue.__init__(self, 0)
+		self.loop = loop
+		self.callback = callback
+
+	def put(self, item, *k, **kw):
+		Queue.put(self, item, *k, **kw)
+		self.loop.call_soon_threadsafe(self.callback)
+
+class AsyncConsumer(TaskConsumer):
+	"""
+	Consumer used for ``waf --executor=asyncio``: a single thread runs an asyncio event loop which takes
+	the tasks from the ready queue of the scheduler. The commands of the tasks created from ``run_str``
+	(see :py:func:`waflib.Task.compile_fun`) are executed as asyncio subprocesses, and the other tasks
+	are passed to a few threads (:py:const:`waflib.Runner.ASYNC_THREADS`). At most *numjobs* tasks are
+	executed at once.
+	"""
+	def __init__(self, numjobs):
+		Utils.threading.Thread.__init__(self)
+		self.reset()
+
+		self.numjobs = numjobs
+		self.running = 0
+		"""Amount of tasks being executed"""
+
+		self.event_loop = asyncio.new_event_loop()
+		self.ready = AsyncQueue(self.event_loop, self.pull)
+
+		self.threads_ready = Queue(0)
+		"""Queue shared by the threads executing the python tasks"""
+		self.threads = [get_pool() for i in range(min(numjobs, ASYNC_THREADS))]
+		def setq(consumer):
+			consumer.ready = self.threads_ready
+		for x in self.threads:
+			x.ready.put(setq)
+
+		self.setDaemon(1)
+		self.start()
+
+	def loop(self):
+		asyncio.set_event_loop(self.event_loop)
+		self.event_loop.run_forever()
+
+	def close(self):
+		"""Stop the event loop and give back the threads to the pool, the tasks must be complete"""
+		self.event_loop.call_soon_threadsafe(self.event_loop.stop)
+		self.join()
+		self.event_loop.close()
+
+		done = Queue(0)
+		def setq(consumer):
+			consumer.ready = Queue(0)
+			done.put(consumer)
+		for x in self.threads:
+			self.threads_ready.put(setq)
+		for x in self.threads:
+			put_pool(done.get())
+		self.threads = []
+
+	def pull(self):
+		"""Take the tasks from the ready queue while less than *numjobs* tasks are running (event loop)"""
+		while self.running < self.numjobs:
+			try:
+				tsk = self.ready.get(False)
+			except:
+				break
+			if not isinstance(tsk, Task.TaskBase):
+				tsk(self)
+				continue
+
+			self.running += 1
+			self.tasks += 1
+			if self.is_command(tsk):
+				self.start_command(tsk)
+			else:
+				self.threads_ready.put(self.make_job(tsk))
+
+	def make_job(self, tsk):
+		"""Return a function executing a python task from a thread (see :py:meth:`waflib.Runner.TaskConsumer.execute`)"""
+		def job(consumer):
+			try:
+				consumer.execute(tsk)
+			finally:
+				self.event_loop.call_soon_threadsafe(self.task_done)
+		return job
+
+	def task_done(self):
+		"""A task is complete, take more tasks from the ready queue (event loop)"""
+		self.running -= 1
+		self.pull()
+
+	def is_command(self, tsk):
+		"""
+		Return True if the method run of the task is compiled from ``run_str`` and executes one command
+		through :py:meth:`waflib.Task.TaskBase.exec_command`, in which case it can be executed asynchronously
+
+		:rtype: bool
+		"""
+		cls = tsk.__class__
+		return getattr(cls.run, 'compiled', False) and cls.exec_command == Task.TaskBase.exec_command
+
+	def get_command(self, tsk):
+		"""
+		Call the method run of the task and intercept the command instead of executing it
+
+		:return: a tuple (command, keyword arguments)
+		"""
+		lst = []
+		def exec_command(cmd, **kw):
+			lst.append((cmd, kw))
+			return 0
+		tsk.exec_command = exec_command
+		try:
+			tsk.run()
+		finally:
+			del tsk.exec_command
+
+		(cmd, kw) = lst[0]
+		bld = tsk.generator.bld
+		if not kw.get('cwd', None):
+			kw['cwd'] = getattr(bld, 'cwd', bld.variant_dir)
+		if 'jobserver' in os.environ.get('MAKEFLAGS', ''):
+			kw['close_fds'] = False
+		if bld.logger:
+			bld.logger.info(cmd)
+			kw['stdout'] = kw['stderr'] = Utils.subprocess.PIPE
+		return (cmd, kw)
+
+	def start_command(self, tsk):
+		"""Start the command of a task as an asyncio subprocess (event loop)"""
+		m = tsk.master
+		if m.stop:
+			m.out.put(tsk)
+			self.command_done(tsk)
+			return
+
+		bld = tsk.generator.bld
+		bld.returned_tasks.append(tsk)
+		tsk.log_display(bld)
+
+		t = time.time()
+		try:
+			(cmd, kw) = self.get_command(tsk)
+			Logs.debug('runner: %r' % cmd)
+			if isinstance(cmd, str):
+				coro = asyncio.create_subprocess_shell(cmd, **kw)
+			else:
+				coro = asyncio.create_subprocess_exec(*cmd, **kw)
+		except Exception:
+			self.command_error(tsk)
+			return
+
+		def started(fut):
+			try:
+				proc = fut.result()
+			except OSError:
+				# same as waflib.Context.Context.exec_command
+				self.command_exited(tsk, -1, t)
+			except Exception:
+				self.command_error(tsk)
+			else:
+				self.event_loop.create_task(proc.communicate()).add_done_callback(lambda fut: exited(proc, fut))
+
+		def exited(proc, fut):
+			try:
+				(out, err) = fut.result()
+				if out:
+					bld.logger.debug('out: %s' % out.decode('utf-8'))
+				if err:
+					bld.logger.error('err: %s' % err.decode('utf-8'))
+			except Exception:
+				self.command_error(tsk)
+			else:
+				self.command_exited(tsk, proc.returncode, t)
+
+		self.event_loop.create_task(coro).add_done_callback(started)
+
+	def command_exited(self, tsk, ret, t):
+		"""The command of a task is complete, process the result (event loop)"""
+		tsk.time_run = time.time() - t
+		self.busy += tsk.time_run
+		try:
+			tsk.process_result(ret)
+		finally:
+			self.command_done(tsk)
+
+	def command_error(self, tsk):
+		"""The command of a task could not be executed (event loop)"""
+		tsk.err_msg = Utils.ex_stack()
+		tsk.hasrun = Task.EXCEPTION
+		tsk.master.error_handler(tsk)
+		tsk.master.out.put(tsk)
+		self.command_done(tsk)
+
+	def command_done(self, tsk):
+		"""Give back the jobserver token of a task executed from the event loop"""
+		if tsk.master.jobserver:
+			tsk.master.jobserver.release(tsk.jobserver_token)
+		self.event_loop.call_soon(self.task_done)
+
 
 class Parallel(object):
 	"""
@@ -75,16 +647,75 @@ class Parallel(object):
 
 		self.bld = bld # build context
 
-		# tasks waiting to be processed - IMPORTANT
-		self.outstanding = []
+		self.critical = getattr(Options.options, 'order', '') == 'critical'
+		"""Process the tasks on the longest chains first, see :py:func:`waflib.Runner.set_critical_path`"""
+
+		# the task generators must not be posted lazily (1 is waflib.Build.POST_LAZY)
+		self.pipeline = getattr(bld, 'pipeline', False) and getattr(bld, 'post_mode', 0) != 1
+		"""Add the next build group when no task is ready, see :py:attr:`waflib.Build.BuildContext.pipeline`"""
+
+		self.outstanding = PriorityTasks()
+		"""Tasks which predecessors (:py:attr:`waflib.Task.Task.run_after`) are complete"""
+
 		self.maxjobs = MAXJOBS
 
+		self.incomplete = set([])
+		"""Tasks waiting for other tasks to complete, see :py:meth:`waflib.Runner.Parallel.mark_finished`"""
+
+		self.revdeps = Utils.defaultdict(set)
+		"""Reverse dependencies: tasks waiting for a particular task to complete"""
+
 		self.frozen = []
-		"""Tasks that cannot be executed immediately are put in this waiting list"""
+		"""Tasks that cannot be executed immediately for other reasons are put in this waiting list"""
 
 		self.out = Queue(0)
 		"""Tasks that have been executed are returned by the consumers in this queue"""
 
+		self.ready = Queue(0)
+		"""Tasks ready to be executed, shared by all the consumers"""
+
+		self.res_used = Utils.defaultdict(float)
+		"""Amount of resources in use for each resource pool, see :py:meth:`waflib.Runner.Parallel.acquire`"""
+
+		self.res_waiting = []
+		"""Tasks ready to be executed but waiting for resources"""
+
+		self.max_load = getattr(Options.options, 'load', 0)
+		"""Do not start new tasks while the system load is above this value (``waf -l``)"""
+
+		self.min_memory = getattr(Options.options, 'min_memory', 0)
+		"""Do not start new tasks while the available memory in MB is below this value (``waf --min-memory``)"""
+
+		self.throttling = False # true while the system is overloaded
+		self.throttle_check = 0 # time of the last reading of the system load
+		self.throttle_events = 0
+		"""Amount of times the task execution was throttled because of the system load or memory"""
+
+		self.time_busy = 0.
+		"""Time spent by all the tasks, used to compute :py:attr:`waflib.Runner.Parallel.parallelism`"""
+
+		self.parallelism = 0.
+		"""Average amount of tasks executed at the same time, computed at the end of the build"""
+
+		self.executor = getattr(Options.options, 'executor', 'threads')
+		"""Execute the tasks from threads (default) or from an asyncio event loop, see :py:class:`waflib.Runner.AsyncConsumer`"""
+		if self.executor == 'asyncio' and (not asyncio or sys.hexversion < 0x3080000):
+			raise Errors.WafError('The asyncio executor requires Python >= 3.8')
+
+		self.use_processes = getattr(Options.options, 'process_pool', False) and j > 1
+		"""Execute the tasks having a :py:attr:`waflib.Task.TaskBase.pool_fun` in worker processes"""
+		if self.use_processes and not multiprocessing:
+			raise Errors.WafError('The process pool requires the multiprocessing module')
+
+		self.process_pool = None
+		"""Pool of worker processes, created by the main thread before the consumers are started"""
+
+		self.jobserver = None
+		"""GNU make jobserver limiting the jobs across processes, see :py:func:`waflib.Runner.get_jobserver`"""
+
+		self.utilisation = []
+		"""Utilisation of the consumers after the build: list of tuples (tasks processed, busy time, busy ratio)"""
+
 		self.count = 0 # tasks not in the producer area
 
 		self.processed = 1 # progress indicator
@@ -92,6 +723,7 @@ class Parallel(object):
 		self.stop = False # error condition to stop the build
 		self.error = [] # tasks in error
 		self.biter = None # build iterator, must give groups of parallelizable tasks on next()
+		self.biter_done = False # the build iterator returned all the groups
 		self.dirty = False # tasks have been executed, the build cache must be saved
 
 	def get_next_task(self):
@@ -101,22 +733,100 @@ class Parallel(object):
 		return self.outstanding.pop(0)
 
 	def postpone(self, tsk):
-		"Override this method to schedule the tasks in a particular order"
-		# TODO consider using a deque instead
-		if random.randint(0, 1):
+		"""
+		Called when a task returns :py:const:`waflib.Task.ASK_LATER`. If the task predecessors are
+		not complete (:py:attr:`waflib.Task.Task.run_after` was updated), the task waits for them,
+		else it is put in the list of frozen tasks which are examined again later.
+		"""
+		if self.wait_for_deps(tsk):
+			return
+		if self.critical:
+			# the order is given by the task priorities
+			self.frozen.append(tsk)
+		elif random.randint(0, 1):
 			self.frozen.insert(0, tsk)
 		else:
 			self.frozen.append(tsk)
 
+	def wait_for_deps(self, tsk):
+		"""
+		Count the predecessors of a task that are not complete, and register the task as waiting for
+		them (:py:attr:`waflib.Runner.Parallel.revdeps`). The task is then added to the set of
+		incomplete tasks and ``True`` is returned, or ``False`` if there is nothing to wait for.
+
+		:param tsk: task
+		:type tsk: :py:class:`waflib.Task.TaskBase`
+		:rtype: bool
+		"""
+		n = 0
+		for k in getattr(tsk, 'run_after', ()):
+			# hasrun is set before post_run_main is executed by get_out
+			if not k.finished:
+				self.revdeps[k].add(tsk)
+				n += 1
+		tsk.pending_deps = n
+		if n:
+			self.incomplete.add(tsk)
+			return True
+		return False
+
+	def add_outstanding(self, tasks):
+		"""
+		Add new tasks to the build: the tasks go to the heap :py:attr:`waflib.Runner.Parallel.outstanding`
+		if they can run immediately, else they wait for their predecessors to complete.
+
+		:param tasks: tasks
+		:type tasks: list of :py:class:`waflib.Task.TaskBase`
+		"""
+		if self.critical:
+			set_critical_path(tasks)
+		for x in tasks:
+			if not self.wait_for_deps(x):
+				self.outstanding.append(x)
+
+	def mark_finished(self, tsk):
+		"""
+		Called when a task is complete (executed, skipped or in error): the task is marked as finished
+		(:py:attr:`waflib.Task.TaskBase.finished`), and the tasks waiting for it are made available once
+		all their predecessors are complete, so that they are never polled.
+
+		:param tsk: task
+		:type tsk: :py:class:`waflib.Task.TaskBase`
+		"""
+		tsk.finished = True
+		try:
+			waiting = self.revdeps.pop(tsk)
+		except KeyError:
+			return
+		for x in waiting:
+			x.pending_deps -= 1
+			if not x.pending_deps and x in self.incomplete:
+				self.incomplete.remove(x)
+				self.outstanding.append(x)
+
 	def refill_task_list(self):
 		"Called to set the next group of tasks"
 
 		while self.count > self.numjobs * GAP or self.count >= self.maxjobs:
 			self.get_out()
 
+		# at least one task is always running, so that the build progresses
+		while self.count and self.is_throttled():
+			self.get_out()
+
+		if self.critical:
+			# the tasks are ordered in the producer area only, so do not queue more than necessary
+			while self.count >= self.numjobs:
+				self.get_out()
+
 		while not self.outstanding:
 			if self.count:
+				if self.pipeline and self.add_next_group():
+					continue
 				self.get_out()
+				if self.outstanding:
+					# tasks of the current group were released by mark_finished
+					break
 			elif self.frozen:
 				try:
 					cond = self.deadlock == self.processed
@@ -139,23 +849,213 @@ class Parallel(object):
 				self.outstanding += self.frozen
 				self.frozen = []
 			elif not self.count:
-				self.outstanding.extend(next(self.biter))
+				if self.incomplete:
+					self.check_incomplete()
+					continue
+				self.add_outstanding(next(self.biter))
 				self.total = self.bld.total()
 				break
 
+	def add_next_group(self):
+		"""
+		Add the tasks of the next build group while tasks of the current group are still running
+		(pipelined builds, see :py:attr:`waflib.Build.BuildContext.pipeline`)
+
+		:return: True if tasks were added
+		:rtype: bool
+		"""
+		if self.biter_done:
+			return False
+		tasks = next(self.biter)
+		if not tasks:
+			self.biter_done = True
+			return False
+		self.add_outstanding(tasks)
+		self.total = self.bld.total()
+		return True
+
+	def is_throttled(self):
+		"""
+		Return True if no task should be started because the system load or the available memory are past the thresholds
+		(:py:attr:`waflib.Runner.Parallel.max_load` and :py:attr:`waflib.Runner.Parallel.min_memory`)
+
+		:rtype: bool
+		"""
+		if not (self.max_load or self.min_memory):
+			return False
+
+		now = time.time()
+		if now - self.throttle_check < THROTTLE_INTERVAL:
+			return self.throttling
+		self.throttle_check = now
+
+		ret = False
+		if self.max_load:
+			load = get_load()
+			if load > self.max_load:
+				ret = True
+		if self.min_memory and not ret:
+			mem = get_memory()
+			if mem is not None and mem < self.min_memory:
+				ret = True
+
+		if ret and not self.throttling:
+			self.throttle_events += 1
+			Logs.debug('runner: throttling the task execution (%d tasks running)', self.count)
+		self.throttling = ret
+		return ret
+
+	def check_incomplete(self):
+		"""
+		Called when no task is running and no task is ready to be executed while some tasks
+		are still waiting for their predecessors. The tasks which predecessors are complete
+		(:py:attr:`waflib.Task.Task.run_after` was modified during the build) are made available,
+		else there is a dependency cycle or a dependency on a task that is never executed.
+		"""
+		for x in list(self.incomplete):
+			if not self.wait_for_deps(x):
+				self.incomplete.remove(x)
+				self.outstanding.append(x)
+		if self.outstanding:
+			return
+
+		lst = []
+		for tsk in self.incomplete:
+			lst.append('%s\t-> %r' % (repr(tsk), [id(x) for x in tsk.run_after if not x.finished]))
+		raise Errors.WafError("Deadlock detected: check the build order for the tasks (dependency cycle?)%s" % ''.join(lst))
+
 	def add_more_tasks(self, tsk):
 		"Tasks may be added dynamically during the build by binding to the list attribute 'more_tasks'"
 		if getattr(tsk, 'more_tasks', None):
-			self.outstanding += tsk.more_tasks
+			self.add_outstanding(tsk.more_tasks)
 			self.total += len(tsk.more_tasks)
 
 	def get_out(self):
 		"The tasks that are put to execute are all collected using get_out"
 		tsk = self.out.get()
+		if tsk.hasrun == Task.SUCCESS:
+			try:
+				tsk.post_run_main()
+			except Exception:
+				if tsk.hasrun == Task.SUCCESS:
+					tsk.err_msg = Utils.ex_stack()
+					tsk.hasrun = Task.EXCEPTION
+				self.error_handler(tsk)
 		if not self.stop:
 			self.add_more_tasks(tsk)
+		self.mark_finished(tsk)
 		self.count -= 1
 		self.dirty = True
+		self.release(tsk)
+		self.time_busy += getattr(tsk, 'time_run', 0)
+
+		# record the execution time for the critical path scheduler
+		if tsk.hasrun == Task.SUCCESS:
+			try:
+				self.bld.task_sigs[(tsk.uid(), 'time')] = tsk.time_run
+			except AttributeError:
+				pass
+
+	def get_resources(self, tsk):
+		"""
+		Resources required by a task from the resource pools (:py:attr:`waflib.Build.BuildContext.pools`).
+		The resources from undeclared pools are ignored.
+
+		:param tsk: task
+		:type tsk: :py:class:`waflib.Task.TaskBase`
+		:return: list of tuples (pool name, amount, pool size)
+		:rtype: list
+		"""
+		ret = []
+		pools = getattr(self.bld, 'pools', {})
+		for (k, v) in getattr(tsk, 'resources', {}).items():
+			try:
+				ret.append((k, v, pools[k]))
+			except KeyError:
+				pass
+		n = getattr(tsk, 'max_concurrent', 0)
+		if n:
+			ret.append((tsk.__class__, 1, n))
+		return ret
+
+	def acquire(self, tsk):
+		"""
+		Reserve the resources required by a task. A task is always accepted when the pools
+		it requires are unused, even if it needs more than the pool size.
+
+		:param tsk: task
+		:type tsk: :py:class:`waflib.Task.TaskBase`
+		:return: True if the task may be executed now
+		:rtype: bool
+		"""
+		res = self.get_resources(tsk)
+		used = self.res_used
+		for (k, v, n) in res:
+			if used[k] and used[k] + v > n:
+				return False
+		for (k, v, n) in res:
+			used[k] += v
+		tsk.res_acquired = res
+		return True
+
+	def release(self, tsk):
+		"""
+		Release the resources held by a task, and execute the tasks that were waiting for them
+
+		:param tsk: task
+		:type tsk: :py:class:`waflib.Task.TaskBase`
+		"""
+		try:
+			res = tsk.res_acquired
+		except AttributeError:
+			return
+		del tsk.res_acquired
+		for (k, v, n) in res:
+			self.res_used[k] -= v
+
+		if self.res_waiting and not self.stop:
+			lst = self.res_waiting
+			self.res_waiting = []
+			for x in lst:
+				if self.acquire(x):
+					self.run_task(x)
+				else:
+					self.res_waiting.append(x)
+
+	def run_task(self, tsk):
+		"""
+		Execute a task immediately (``-j1``) or pass it to the consumers
+
+		:param tsk: task
+		:type tsk: :py:class:`waflib.Task.TaskBase`
+		"""
+		tsk.position = (self.processed, self.total)
+		self.count += 1
+		tsk.master = self
+		self.processed += 1
+
+		if self.numjobs == 1:
+			tsk.process()
+		else:
+			if self.jobserver:
+				tsk.jobserver_token = self.jobserver.acquire()
+			self.add_task(tsk)
+
+	def run_in_process(self, tsk):
+		"""
+		Execute :py:attr:`waflib.Task.TaskBase.pool_fun` in a worker process and wait for the result (executed by threads)
+
+		:param tsk: task
+		:type tsk: :py:class:`waflib.Task.Task`
+		:return: the exit status from :py:meth:`waflib.Task.TaskBase.pool_result`
+		:rtype: int
+		"""
+		args = tsk.pool_args()
+		if args is None:
+			# the task cannot be described for the worker processes
+			return tsk.run()
+		(ret, tsk.pool_sigs) = self.process_pool.apply(run_pool_fun, (tsk.pool_fun, args, Utils.hash_algo))
+		return tsk.pool_result(ret)
 
 	def error_handler(self, tsk):
 		"By default, errors make the build stop (not thread safe so be careful)"
@@ -164,26 +1064,67 @@ class Parallel(object):
 		self.error.append(tsk)
 
 	def add_task(self, tsk):
-		"Add a task to one of the consumers"
+		"Add a task to the queue shared by the consumers"
+		try:
+			self.pool
+		except AttributeError:
+			self.init_task_pool()
+		self.ready.put(tsk)
+
+	def init_task_pool(self):
+		"""Obtain the consumers (lazy creation) and make them use the queue :py:attr:`waflib.Runner.Parallel.ready`"""
+		self.pool_timer = time.time()
+		if self.use_processes and not self.process_pool:
+			# fork before creating the consumer threads
+			self.process_pool = multiprocessing.Pool(self.numjobs)
+		if self.executor == 'asyncio':
+			# the event loop is woken up when tasks are added to its queue
+			x = AsyncConsumer(self.numjobs)
+			self.ready = x.ready
+			self.pool = [x]
+			return self.pool
+
+		pool = self.pool = [get_pool() for i in range(self.numjobs)]
+		def setq(consumer):
+			consumer.reset()
+			consumer.ready = self.ready
+		for x in pool:
+			x.ready.put(setq)
+		return pool
+
+	def free_task_pool(self):
+		"""
+		Give a different queue to each consumer and return the consumers to the pool. The consumer
+		statistics are collected in :py:attr:`waflib.Runner.Parallel.utilisation`.
+		"""
 		try:
 			pool = self.pool
 		except AttributeError:
-			# lazy creation
-			pool = self.pool = [get_pool() for i in range(self.numjobs)]
-
-		# better load distribution across the consumers (makes more sense on distributed systems)
-		# there are probably ways to have consumers use a unique queue
-		a = pool[random.randint(0, len(pool) - 1)]
-		siz = a.ready.qsize()
-		if not siz:
-			a.ready.put(tsk)
 			return
 
-		b = pool[random.randint(0, len(pool) - 1)]
-		if siz > b.ready.qsize():
-			b.ready.put(tsk)
-		else:
-			a.ready.put(tsk)
+		def setq(consumer):
+			consumer.ready = Queue(0)
+			self.out.put(consumer)
+		for x in pool:
+			self.ready.put(setq)
+		n = 0
+		while n < len(pool):
+			# the consumers are returned instead of tasks, do not use get_out
+			if isinstance(self.out.get(), TaskConsumer):
+				n += 1
+
+		elapsed = max(time.time() - self.pool_timer, 1e-9)
+		self.utilisation = [(x.tasks, x.busy, x.busy / elapsed) for x in pool]
+		for (i, (tasks, busy, ratio)) in enumerate(self.utilisation):
+			Logs.debug('runner: consumer %d processed %d tasks, busy %.3fs (%d%%)', i, tasks, busy, 100 * ratio)
+
+		for x in pool:
+			if isinstance(x, AsyncConsumer):
+				x.close()
+				self.ready = Queue(0)
+			else:
+				put_pool(x)
+		self.pool = []
 
 	def start(self):
 		"""
@@ -195,6 +1136,10 @@ class Parallel(object):
 		"""
 
 		self.total = self.bld.total()
+		t = time.time()
+
+		if self.numjobs > 1:
+			self.jobserver = get_jobserver(self.numjobs, getattr(Options.options, 'jobserver', False))
 
 		while not self.stop:
 
@@ -213,6 +1158,7 @@ class Parallel(object):
 			if tsk.hasrun:
 				# if the task is marked as "run", just skip it
 				self.processed += 1
+				self.mark_finished(tsk)
 				continue
 
 			try:
@@ -221,35 +1167,27 @@ class Parallel(object):
 				self.processed += 1
 				if self.stop and not self.bld.keep:
 					tsk.hasrun = Task.SKIPPED
+					self.mark_finished(tsk)
 					continue
 				tsk.err_msg = Utils.ex_stack()
 				tsk.hasrun = Task.EXCEPTION
 				self.error_handler(tsk)
+				self.mark_finished(tsk)
 				continue
 
 			if st == Task.ASK_LATER:
 				self.postpone(tsk)
-				# TODO optimize this
-				if self.outstanding:
-					for x in tsk.run_after:
-						if x in self.outstanding:
-							self.outstanding.remove(x)
-							self.outstanding.insert(0, x)
 			elif st == Task.SKIP_ME:
 				self.processed += 1
 				tsk.hasrun = Task.SKIPPED
 				self.add_more_tasks(tsk)
+				self.mark_finished(tsk)
+			elif not self.acquire(tsk):
+				# run me, but not before other tasks release their resources
+				self.res_waiting.append(tsk)
 			else:
 				# run me: put the task in ready queue
-				tsk.position = (self.processed, self.total)
-				self.count += 1
-				tsk.master = self
-				self.processed += 1
-
-				if self.numjobs == 1:
-					tsk.process()
-				else:
-					self.add_task(tsk)
+				self.run_task(tsk)
 
 		# self.count represents the tasks that have been made available to the consumer threads
 		# collect all the tasks after an error else the message may be incomplete
@@ -257,12 +1195,17 @@ class Parallel(object):
 			self.get_out()
 
 		# free the task pool, if any
-		try:
-			while self.pool:
-				x = self.pool.pop()
-				put_pool(x)
-		except AttributeError:
-			pass
+		self.free_task_pool()
+
+		if self.jobserver:
+			self.jobserver.close()
+
+		if self.process_pool:
+			self.process_pool.close()
+			self.process_pool.join()
+			self.process_pool = None
+
+		self.parallelism = self.time_busy / max(time.time() - t, 1e-9)
 
 		#print loop
 		assert (self.count == 0 or self.stop)
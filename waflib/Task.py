@@ -6,7 +6,7 @@
 Tasks represent atomic operations such as processes.
 """
 
-import os, shutil, re, tempfile
+import os, shutil, re, tempfile, time
 from waflib import Utils, Logs, Errors
 
 # task states
@@ -123,6 +123,7 @@ class store_task_type(type):
 				cls.hcode = cls.run_str
 				cls.run_str = None
 				cls.run = f
+				f.compiled = True
 				cls.vars.extend(dvars)
 			elif getattr(cls, 'run', None) and not 'hcode' in cls.__dict__:
 				# getattr(cls, 'hcode') would look in the upper classes
@@ -169,6 +170,30 @@ class TaskBase(evil):
 	hcode = ''
 	"""String representing an additional hash for the class representation"""
 
+	resources = {}
+	"""
+	Amounts of resources used by the task instances, for example ``{'link': 1, 'memory_gb': 16}``. The resource
+	pools are declared on the build context (:py:attr:`waflib.Build.BuildContext.pools`), and the tasks
+	requiring more than what remains available wait until other tasks release their resources.
+	"""
+
+	finished = False
+	"""
+	Set by the main thread once the task is complete (:py:meth:`waflib.Runner.Parallel.mark_finished`), after
+	:py:meth:`waflib.Task.TaskBase.post_run_main`. The attribute *hasrun* is set earlier by the consumer threads.
+	"""
+
+	max_concurrent = 0
+	"""Maximum amount of instances of this class executed at the same time (0 means no limit)"""
+
+	pool_fun = None
+	"""
+	Function executed in a worker process instead of the method run when ``waf --process-pool`` is given,
+	for the python tasks limited by the GIL. It must be declared with ``staticmethod`` in a module that
+	can be imported (a Waf tool), it receives the picklable value of :py:meth:`waflib.Task.Task.pool_args`,
+	and its return value is passed to :py:meth:`waflib.Task.TaskBase.pool_result` in the main process.
+	"""
+
 	def __init__(self, *k, **kw):
 		"""
 		The base task class requires a task generator, which will be itself if missing
@@ -237,8 +262,14 @@ class TaskBase(evil):
 		self.generator.bld.returned_tasks.append(self)
 		self.log_display(self.generator.bld)
 
+		t = time.time()
 		try:
-			ret = self.run()
+			if self.pool_fun and m.use_processes:
+				ret = m.run_in_process(self)
+			else:
+				ret = self.run()
+			self.time_run = time.time() - t
+			self.generator.bld.add_stat('execute', self.time_run)
 		except Exception as e:
 			self.err_msg = Utils.ex_stack()
 			self.hasrun = EXCEPTION
@@ -248,6 +279,28 @@ class TaskBase(evil):
 			m.out.put(self)
 			return
 
+		self.process_result(ret)
+
+	def pool_result(self, ret):
+		"""
+		Process the value returned by :py:attr:`waflib.Task.TaskBase.pool_fun` in the main process (executed by threads)
+
+		:return: the exit status, as for the method run
+		:rtype: int
+		"""
+		return ret
+
+	def process_result(self, ret):
+		"""
+		Set the task state from the value returned by :py:meth:`waflib.Task.TaskBase.run`, call
+		:py:meth:`waflib.Task.TaskBase.post_run` on success, and put the task back in the queue
+		:py:attr:`waflib.Runner.Parallel.out`. Used by :py:class:`waflib.Runner.AsyncConsumer` for
+		the tasks which commands are executed asynchronously.
+
+		:param ret: return value of the method run
+		:type ret: int
+		"""
+		m = self.master
 		if ret:
 			self.err_code = ret
 			self.hasrun = CRASHED
@@ -280,6 +333,15 @@ class TaskBase(evil):
 		"Update the cache files (executed by threads). Override in subclasses."
 		pass
 
+	def post_run_main(self):
+		"""
+		Called by the main thread after a successful execution, once :py:meth:`waflib.Task.TaskBase.post_run` has
+		been executed by a consumer thread, and before the task is marked as finished and the tasks waiting for
+		this one are released.
+		The data shared between the threads, such as the node tree, may be modified safely. Override in subclasses.
+		"""
+		pass
+
 	def log_display(self, bld):
 		"Write the execution status on the context logger"
 		bld.to_log(self.display())
@@ -513,10 +575,15 @@ class Task(TaskBase):
 		bld = self.generator.bld
 
 		# first compute the signature
+		if bld.stats is not None:
+			t = time.time()
 		try:
 			new_sig = self.signature()
 		except Errors.TaskNotReady:
 			return ASK_LATER
+		finally:
+			if bld.stats is not None:
+				bld.add_stat('signature', time.time() - t)
 
 		# compare the signature to a signature computed previously
 		key = self.uid()
@@ -527,9 +594,14 @@ class Task(TaskBase):
 			return RUN_ME
 
 		# compare the signatures of the outputs
+		# in restat mode, the outputs have the signatures of their contents (see Task.post_run)
+		restat = bld.restat
 		for node in self.outputs:
 			try:
-				if node.sig != new_sig:
+				if restat:
+					if not node.sig:
+						return RUN_ME
+				elif node.sig != new_sig:
 					return RUN_ME
 			except AttributeError:
 				Logs.debug("task: task %r must run as the output nodes do not exist" % self)
@@ -545,13 +617,17 @@ class Task(TaskBase):
 		and :py:attr:`waflib.Build.BuildContext.task_sigs`.
 
 		The node signature is obtained from the task signature, but the output nodes may also get the signature
-		of their contents. See the class decorator :py:func:`waflib.Task.update_outputs` if you need this behaviour.
+		of their contents. See the class decorator :py:func:`waflib.Task.update_outputs` if you need this behaviour
+		for a few classes, or :py:attr:`waflib.Build.BuildContext.restat` (``waf --restat``) for all the tasks.
+		The contents are hashed by the consumer threads, right after the execution of each task.
 		"""
 		bld = self.generator.bld
 		env = self.env
 		sig = self.signature()
+		restat = bld.restat
+		sigs = getattr(self, 'pool_sigs', None)
 
-		for node in self.outputs:
+		for (i, node) in enumerate(self.outputs):
 			# check if the node exists ..
 			try:
 				os.stat(node.abspath())
@@ -561,10 +637,29 @@ class Task(TaskBase):
 				raise Errors.WafError(self.err_msg)
 
 			# important, store the signature for the next run
-			node.sig = sig
+			if restat:
+				# the tasks using the output are skipped if its contents did not change (early cutoff)
+				node.sig = sigs and sigs[i] or Utils.h_file(node.abspath())
+			else:
+				node.sig = sig
 
 		bld.task_sigs[self.uid()] = self.cache_sig
 
+	def pool_args(self):
+		"""
+		Picklable description of the task for :py:attr:`waflib.Task.TaskBase.pool_fun`: the absolute paths
+		of the inputs and of the outputs, and the values of the variables in :py:attr:`waflib.Task.Task.vars`.
+		Subclasses may return None to execute the method run in the current process instead.
+
+		:rtype: dict or None
+		"""
+		env = self.env
+		return {
+			'inputs': [x.abspath() for x in self.inputs],
+			'outputs': [x.abspath() for x in self.outputs],
+			'env': dict([(x, env[x]) for x in self.vars]),
+		}
+
 	def sig_explicit_deps(self):
 		"""
 		Used by :py:meth:`waflib.Task.Task.signature`, hash :py:attr:`waflib.Task.Task.inputs`
@@ -671,7 +766,20 @@ class Task(TaskBase):
 			raise Errors.TaskRescan('rescan')
 
 		# no previous run or the signature of the dependencies has changed, rescan the dependencies
-		(nodes, names) = self.scan()
+		try:
+			# scanned in a worker process, see waflib.Build.BuildContext.prescan
+			(nodes, names) = self.scan_results
+			del self.scan_results
+		except AttributeError:
+			if bld.scan_queue is not None:
+				bld.scan_queue.append(self)
+				raise Errors.TaskNotReady('the dependencies will be scanned in advance')
+			if bld.stats is not None:
+				t = time.time()
+				(nodes, names) = self.scan()
+				bld.add_stat('scan', time.time() - t)
+			else:
+				(nodes, names) = self.scan()
 		if Logs.verbose:
 			Logs.debug('deps: scanner for %s returned %s %s' % (str(self), str(nodes), str(names)))
 
@@ -800,8 +908,9 @@ class Task(TaskBase):
 		if t1 != t2:
 			return None
 
+		restat = self.generator.bld.restat
 		for node in self.outputs:
-			node.sig = sig
+			node.sig = restat and Utils.h_file(node.abspath()) or sig
 			if self.generator.bld.progress_bar < 1:
 				self.generator.bld.to_log('restoring from cache %r\n' % node.abspath())
 
@@ -932,6 +1041,47 @@ def set_precedence_constraints(tasks):
 			for x in cstr_groups[keys[b]]:
 				x.run_after.update(cstr_groups[keys[a]])
 
+def set_pipeline_constraints(previous, tasks):
+	"""
+	Add tasks from the previous build groups to the task 'run_after' attribute of the new tasks, based on the
+	inputs/outputs and on the after/before/ext_out/ext_in attributes. Used when the build groups overlap
+	(see :py:attr:`waflib.Build.BuildContext.pipeline`), the previous tasks are never made to wait for the new ones.
+	The new tasks having a scanner wait for all the previous tasks producing files in the build directory.
+
+	:param previous: tasks from previous groups that are not complete yet
+	:type previous: list of :py:class:`waflib.Task.TaskBase`
+	:param tasks: tasks from the new group
+	:type tasks: list of :py:class:`waflib.Task.TaskBase`
+	"""
+	outs = Utils.defaultdict(set)
+	producers = set([])
+	for x in previous:
+		for a in getattr(x, 'outputs', []):
+			outs[id(a)].add(x)
+			if a.is_child_of(x.generator.bld.bldnode):
+				producers.add(x)
+	for x in tasks:
+		for a in getattr(x, 'inputs', []) + getattr(x, 'dep_nodes', []):
+			if id(a) in outs:
+				x.run_after.update(outs[id(a)])
+		# the dependencies found by the scanners (generated headers) are not known yet
+		if getattr(x, 'scan', None):
+			x.run_after.update(producers)
+
+	prev_groups = Utils.defaultdict(list)
+	for x in previous:
+		prev_groups[x.hash_constraints()].append(x)
+	cstr_groups = Utils.defaultdict(list)
+	for x in tasks:
+		cstr_groups[x.hash_constraints()].append(x)
+
+	for lst in cstr_groups.values():
+		t2 = lst[0]
+		for prev in prev_groups.values():
+			if is_before(prev[0], t2):
+				for x in lst:
+					x.run_after.update(prev)
+
 def funex(c):
 	"""
 	Compile a function by 'exec'
@@ -1132,8 +1282,10 @@ def update_outputs(cls):
 	old_post_run = cls.post_run
 	def post_run(self):
 		old_post_run(self)
-		for node in self.outputs:
-			node.sig = Utils.h_file(node.abspath())
+		# the signatures are computed by the worker processes, if any (waflib.Runner.run_pool_fun)
+		sigs = getattr(self, 'pool_sigs', None)
+		for (i, node) in enumerate(self.outputs):
+			node.sig = sigs and sigs[i] or Utils.h_file(node.abspath())
 	cls.post_run = post_run
 
 
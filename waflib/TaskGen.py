@@ -254,6 +254,8 @@ class task_gen(object):
 		:rtype: :py:class:`waflib.Task.TaskBase`
 		"""
 		task = Task.classes[name](env=self.env.derive(), generator=self)
+		if getattr(self, 'resources', None):
+			task.resources = self.resources
 		if src:
 			task.set_inputs(src)
 		if tgt:
@@ -596,12 +598,85 @@ def sequence_order(self):
 
 re_m4 = re.compile('@(\w+)@', re.M)
 
+def subst_pc_fun(args):
+	"""
+	Substitution performed by :py:class:`waflib.TaskGen.subst_pc` in the worker processes (``waf --process-pool``).
+	The values are taken from ``args['dct']`` if given, else from the task generator attributes
+	``args['attrs']`` and from the flattened environment ``args['env']``.
+
+	:return: the list of variables used
+	:rtype: list of string
+	"""
+	code = Utils.readf(args['inputs'][0])
+	code = code.replace('%', '%%')
+
+	lst = []
+	def repl(match):
+		g = match.group
+		if g(1):
+			lst.append(g(1))
+			return "%%(%s)s" % g(1)
+		return ''
+	code = re_m4.sub(repl, code)
+
+	d = args['dct']
+	if d is None:
+		d = {}
+		attrs = args['attrs']
+		env = args['env']
+		for x in lst:
+			d[x] = attrs.get(x, '') or env.get(x, '') or env.get(x.upper(), '')
+			if not d[x] and not attrs.get('quiet', False):
+				raise ValueError('variable %r has no value for %r' % (x, args['outputs']))
+
+	f = open(args['outputs'][0], 'w')
+	try:
+		f.write(code % d)
+	finally:
+		f.close()
+	return lst
+
 class subst_pc(Task.Task):
 	"""
 	Create *.pc* files from *.pc.in*. The task is executed whenever an input variable used
 	in the substitution changes.
 	"""
 
+	pool_fun = staticmethod(subst_pc_fun)
+
+	def pool_args(self):
+		"""
+		The task generator attributes used in the input file and the whole environment are passed
+		to :py:func:`waflib.TaskGen.subst_pc_fun`. If an attribute used does not hold a simple value,
+		the task is executed in the current process as the substitution would differ.
+		"""
+		args = Task.Task.pool_args(self)
+		args['dct'] = getattr(self.generator, 'dct', None)
+		if args['dct'] is None:
+			attrs = args['attrs'] = {'quiet': getattr(self.generator, 'quiet', False)}
+			for x in re_m4.findall(self.inputs[0].read()):
+				v = getattr(self.generator, x, None)
+				if v is None:
+					continue
+				if not isinstance(v, (str, int, float)):
+					return None
+				attrs[x] = v
+
+			env = args['env'] = {}
+			for (k, v) in self.env.get_merged_dict().items():
+				try:
+					env[k] = isinstance(v, str) and v or ' '.join(v)
+				except TypeError:
+					pass
+		return args
+
+	def pool_result(self, lst):
+		"""Store the variables used, returned by :py:func:`waflib.TaskGen.subst_pc_fun`"""
+		self.generator.bld.raw_deps[self.uid()] = self.dep_vars = lst
+		try: delattr(self, 'cache_sig')
+		except AttributeError: pass
+		return 0
+
 	def run(self):
 		"Substitutes variables in a .in file"
 
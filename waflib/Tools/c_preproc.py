@@ -18,15 +18,19 @@ c. system headers are not scanned by default
 
 Now if you do not want the Waf preprocessor, the tool "gccdeps" uses the .d files produced
 during the compilation to track the dependencies (useful when used with the boost libraries).
-It only works with gcc though.
+It only works with gcc, clang and icc though, and it may be enabled for some task generators only.
 
 A dumb preprocessor is also available in the tool "c_dumbpreproc"
 """
 # TODO: more varargs, pragma once
 
 import re, sys, os, string, traceback
+try: import cPickle
+except ImportError: import pickle as cPickle
+try: import mmap
+except ImportError: mmap = None
 from stat import S_ISREG, ST_MODE
-from waflib import Logs, Build, Utils, Errors
+from waflib import Logs, Build, Utils, Errors, Context
 from waflib.Logs import debug, error
 
 class PreprocError(Errors.WafError):
@@ -47,6 +51,22 @@ use_trigraphs = 0
 strict_quotes = 0
 "Keep <> for system includes (do not search for those includes)"
 
+cache_age = 10
+"Keep the lines of the headers parsed for the N last builds (see :py:func:`waflib.Tools.c_preproc.load_cache`), set to 0 to disable the cache"
+
+CACHE_FILE = Context.DBFILE + '.preproc'
+"File in the build directory containing the lines of the headers parsed in the previous builds"
+
+mmap_size = 1048576
+"Map the files larger than this size in memory instead of reading them (see :py:func:`waflib.Tools.c_preproc.filter_comments`)"
+
+lock = Utils.threading.Lock()
+"""
+Lock for the creation of the nodes and of the caches shared by the build context, as the scanner may be called by several
+threads (see :py:meth:`waflib.Build.BuildContext.prescan_threads`). The other caches are dicts, their entries are only
+added or replaced.
+"""
+
 g_optrans = {
 'not':'!',
 'and':'&&',
@@ -74,6 +94,19 @@ re_cpp = re.compile(
 	r"""(/\*[^*]*\*+([^/*][^*]*\*+)*/)|//[^\n]*|("(\\.|[^"\\])*"|'(\\.|[^'\\])*'|.[^/"'\\]*)""",
 	re.MULTILINE)
 trig_def = [('??'+a, b) for a, b in zip("=-/!'()<>", r'#~\|^[]{}')]
+
+# for filter_comments, on the file contents in binary form
+tok_comment = r'/\*[^*]*\*+(?:[^/*][^*]*\*+)*/'
+tok_string = r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\''
+re_nl_b = re.compile(r'\\\r*\n'.encode(), re.MULTILINE)
+re_bof = re.compile(r'[ \t]*(#|%:)'.encode())
+re_blank = re.compile(r'[ \t]*'.encode())
+re_candidate = re.compile(r'\n[ \t]*(#|%:)'.encode())
+re_comment = re.compile(tok_comment.encode())
+re_string = re.compile(tok_string.encode())
+re_special = re.compile((r'(?P<n>\n)|(?P<c>' + tok_comment + r')|(?P<l>//)|(?P<s>' + tok_string + ')').encode())
+re_directive = re.compile(r'(?:#|%:)[ \t]*(ifdef|ifndef|if|else|elif|endif|include|import|define|undef|pragma)[ \t]*(.*)', re.IGNORECASE)
+NL, SPACE, SLASH, COMMENT, COMMENT_END, LINE, DQUOTE, SQUOTE = [x.encode() for x in ('\n', ' ', '/', '/*', '*/', '//', '"', "'")]
 chr_esc = {'0':0, 'a':7, 'b':8, 't':9, 'n':10, 'f':11, 'v':12, 'r':13, '\\':92, "'":39}
 
 NUM   = 'i'
@@ -103,13 +136,297 @@ def repl(m):
 	return m.group(3) or ''
 
 def filter_comments(filename):
-	# return a list of tuples : keyword, line
-	code = Utils.readf(filename)
-	if use_trigraphs:
-		for (a, b) in trig_def: code = code.split(a).join(b)
-	code = re_nl.sub('', code)
-	code = re_cpp.sub(repl, code)
-	return [(m.group(2), m.group(3)) for m in re.finditer(re_lines, code)]
+	"""
+	Extract the preprocessor directives from a file: the line continuations (:py:const:`waflib.Tools.c_preproc.re_nl`)
+	and the comments (:py:const:`waflib.Tools.c_preproc.re_cpp`) are removed from the whole text before looking for the
+	directive lines (:py:const:`waflib.Tools.c_preproc.re_lines`). The files larger than :py:const:`waflib.Tools.c_preproc.mmap_size`
+	(or which cannot be decoded) are read as bytes or mapped in memory instead, and processed by
+	:py:func:`waflib.Tools.c_preproc.extract_directives` without copying them.
+
+	:param filename: path to the file
+	:type filename: string
+	:return: list of tuples (keyword, line)
+	:rtype: list
+	"""
+	size = os.stat(filename).st_size
+	if size <= mmap_size:
+		# the regular expressions are faster on the usual headers
+		try:
+			code = Utils.readf(filename)
+		except UnicodeDecodeError:
+			# the comments may use another encoding, only the directive lines are decoded below
+			pass
+		else:
+			if use_trigraphs:
+				for (a, b) in trig_def: code = code.replace(a, b)
+			code = re_nl.sub('', code)
+			code = re_cpp.sub(repl, code)
+			return [(m.group(2), m.group(3)) for m in re.finditer(re_lines, code)]
+
+	f = open(filename, 'rb')
+	try:
+		if mmap and size > mmap_size:
+			buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		else:
+			buf = f.read()
+	finally:
+		f.close()
+
+	try:
+		code = buf
+		if use_trigraphs:
+			code = code[:]
+			for (a, b) in trig_def: code = code.replace(a.encode(), b.encode())
+		if re_nl_b.search(code):
+			code = re_nl_b.sub(''.encode(), code)
+		return extract_directives(code)
+	finally:
+		if not isinstance(buf, bytes):
+			buf.close()
+
+def extract_directives(buf):
+	"""
+	Find the directive lines for :py:func:`waflib.Tools.c_preproc.filter_comments` in a large text without line continuations.
+	The search jumps from one comment, string literal or line starting with ``#`` to the next, and only the directive lines
+	are filtered and decoded.
+
+	:param buf: file contents
+	:type buf: bytes or mmap
+	:return: list of tuples (keyword, line)
+	:rtype: list
+	"""
+	ret = []
+	empty = ''.encode()
+
+	def read_line(pos, in_string):
+		# return the line starting at pos without the comments, the position of the end of the line,
+		# and the end of the string literal containing the end of the line (string literals may contain newlines)
+		lst = []
+		if in_string:
+			nl = buf.find(NL, pos, in_string)
+			if nl >= 0:
+				return (buf[pos:nl], nl, in_string)
+			lst.append(buf[pos:in_string])
+			pos = in_string
+		else:
+			nl = buf.find(NL, pos)
+			if nl < 0:
+				nl = len(buf)
+			txt = buf[pos:nl]
+			if not (SLASH in txt or DQUOTE in txt or SQUOTE in txt):
+				return (txt, nl, 0)
+		while 1:
+			m = re_special.search(buf, pos)
+			if not m:
+				lst.append(buf[pos:])
+				return (empty.join(lst), len(buf), 0)
+			kind = m.lastgroup
+			q = m.start()
+			lst.append(buf[pos:q])
+			if kind == 'n':
+				return (empty.join(lst), q, 0)
+			elif kind == 'l':
+				nl = buf.find(NL, q)
+				if nl < 0:
+					nl = len(buf)
+				return (empty.join(lst), nl, 0)
+			elif kind == 'c':
+				lst.append(SPACE)
+			else:
+				nl = buf.find(NL, q, m.end())
+				if nl >= 0:
+					lst.append(buf[q:nl])
+					return (empty.join(lst), nl, m.end())
+				lst.append(buf[q:m.end()])
+			pos = m.end()
+
+	def directive(pos, in_string):
+		(txt, end, in_string) = read_line(pos, in_string)
+		m = re_directive.match(txt.decode('utf-8'))
+		if m:
+			ret.append((m.group(1), m.group(2).rstrip('\r')))
+		return (end, in_string)
+
+	size = len(buf)
+	def find(sub, start):
+		k = buf.find(sub, start)
+		if k < 0:
+			return size
+		return k
+
+	pos = in_string = 0
+	m = re_bof.match(buf)
+	if m:
+		(pos, in_string) = directive(m.start(1), 0)
+
+	# next positions of a directive candidate, of a comment and of the string literals
+	# they are searched as plain substrings, which is much faster than a regular expression with alternatives
+	cand = comment = dquote = squote = -1
+	while 1:
+		if in_string:
+			# the lines in a string literal are read as they are
+			m = re_candidate.search(buf, pos, in_string)
+			if m:
+				(pos, in_string) = directive(m.start(1), in_string)
+				continue
+			pos = in_string
+			in_string = 0
+
+		if cand < pos:
+			m = re_candidate.search(buf, pos)
+			cand = m and m.start(1) or size
+		if comment < pos:
+			comment = find(COMMENT, pos)
+		if dquote < pos:
+			dquote = find(DQUOTE, pos)
+		if squote < pos:
+			squote = find(SQUOTE, pos)
+
+		e = min(cand, comment, dquote, squote)
+		if e >= size:
+			break
+		if e == cand:
+			(pos, in_string) = directive(e, 0)
+			continue
+
+		# a line comment before the comment or the string literal hides the rest of the line
+		k = buf.find(LINE, max(pos, buf.rfind(NL, 0, e) + 1), e + 1)
+		if k >= 0:
+			pos = find(NL, k)
+			continue
+
+		if e == comment:
+			k = buf.find(COMMENT_END, e + 2)
+			if k < 0:
+				pos = e + 1
+				continue
+			pos = k + 2
+
+			# a comment is replaced by a space, so a directive may follow a comment starting a line
+			k = re_blank.match(buf, pos).end()
+			if not re_bof.match(buf, k) and buf[k:k + 2] != COMMENT:
+				continue
+			if re_blank.match(buf, buf.rfind(NL, 0, e) + 1).end() < e:
+				continue
+			while 1:
+				m = re_bof.match(buf, k)
+				if m:
+					(pos, in_string) = directive(m.start(1), 0)
+					break
+				m = re_comment.match(buf, k)
+				if not m:
+					break
+				pos = m.end()
+				k = re_blank.match(buf, pos).end()
+		else:
+			m = re_string.match(buf, e)
+			if not m:
+				pos = e + 1
+			elif buf.find(NL, e, m.end()) >= 0:
+				pos = e
+				in_string = m.end()
+			else:
+				pos = m.end()
+	return ret
+
+def shared_cache(bld, name):
+	"""
+	Obtain a dict stored on the build context, and create it under :py:const:`waflib.Tools.c_preproc.lock`
+	if necessary
+
+	:param bld: build context
+	:type bld: :py:class:`waflib.Build.BuildContext`
+	:param name: attribute name
+	:type name: string
+	:rtype: dict
+	"""
+	try:
+		return getattr(bld, name)
+	except AttributeError:
+		pass
+	lock.acquire()
+	try:
+		try:
+			return getattr(bld, name)
+		except AttributeError:
+			ret = {}
+			setattr(bld, name, ret)
+			return ret
+	finally:
+		lock.release()
+
+def load_cache(bld):
+	"""
+	Load the lines of the headers parsed in the previous builds (:py:func:`waflib.Tools.c_preproc.filter_comments`)
+	from the file :py:const:`waflib.Tools.c_preproc.CACHE_FILE`. The files are indexed by path, and each entry holds
+	the file signature (:py:meth:`waflib.Node.Node.get_bld_sig`), the lines, and the number of the last build using them.
+	The entries of the files modified are replaced when the files are parsed again.
+
+	The cache is loaded once per build, and written by :py:func:`waflib.Tools.c_preproc.store_cache` after a successful build.
+
+	:param bld: build context
+	:type bld: :py:class:`waflib.Build.BuildContext`
+	:return: the cache, or None if it is disabled (:py:const:`waflib.Tools.c_preproc.cache_age`)
+	:rtype: dict
+	"""
+	try:
+		return bld.preproc_cache
+	except AttributeError:
+		pass
+
+	lock.acquire()
+	try:
+		try:
+			return bld.preproc_cache
+		except AttributeError:
+			pass
+		cache = None
+		if cache_age > 0:
+			cache = {'hash_algo': Utils.hash_algo, 'count': 0, 'files': {}}
+			try:
+				f = open(os.path.join(bld.variant_dir, CACHE_FILE), 'rb')
+				try:
+					data = cPickle.load(f)
+				finally:
+					f.close()
+			except Exception:
+				debug('preproc: no header cache to load')
+			else:
+				# the file signatures depend on the hash function
+				if data.get('hash_algo') == Utils.hash_algo:
+					cache = data
+			cache['count'] += 1
+			bld.add_post_fun(store_cache)
+		bld.preproc_cache = cache
+		return cache
+	finally:
+		lock.release()
+
+def store_cache(bld):
+	"""
+	Write the cache loaded by :py:func:`waflib.Tools.c_preproc.load_cache`, removing the files
+	that were not parsed in the last :py:const:`waflib.Tools.c_preproc.cache_age` builds
+
+	:param bld: build context
+	:type bld: :py:class:`waflib.Build.BuildContext`
+	"""
+	cache = bld.preproc_cache
+	limit = cache['count'] - cache_age
+	files = cache['files']
+	for (k, v) in list(files.items()):
+		if v[2] <= limit:
+			del files[k]
+
+	path = os.path.join(bld.variant_dir, CACHE_FILE)
+	try:
+		f = open(path + '.tmp', 'wb')
+		try:
+			cPickle.dump(cache, f, -1)
+		finally:
+			f.close()
+		os.rename(path + '.tmp', path)
+	except (IOError, OSError) as e:
+		debug('preproc: could not write the header cache %r: %s', path, e)
 
 prec = {}
 # op -> number, needed for such expressions:   #if 1 && 2 != 0
@@ -320,10 +637,10 @@ def reduce_tokens(lst, defs, ban=[]):
 
 		elif p == IDENT and v in defs:
 
-			if isinstance(defs[v], str):
-				a, b = extract_macro(defs[v])
-				defs[v] = b
 			macro_def = defs[v]
+			if isinstance(macro_def, str):
+				# the macros are not replaced by their parsed form in defs, see c_parser.addlines
+				macro_def = parse_macro(macro_def)
 			to_add = macro_def[1]
 
 			if isinstance(macro_def[0], list):
@@ -512,6 +829,11 @@ def extract_macro(txt):
 		(p, v) = t[0]
 		return (v, [[], t[1:]])
 
+@Utils.run_once
+def parse_macro(txt):
+	"""Cached version of :py:func:`waflib.Tools.c_preproc.extract_macro` returning the parsed macro only"""
+	return extract_macro(txt)[1]
+
 re_include = re.compile('^\s*(<(?P<a>.*)>|"(?P<b>.*)")')
 def extract_include(txt, defs):
 	"""process a line in the form "#include foo" to return a string representing the file"""
@@ -553,9 +875,20 @@ def parse_char(txt):
 		try: return chr_esc[c]
 		except KeyError: raise PreprocError("could not parse char literal '%s'" % txt)
 
-@Utils.run_once
 def tokenize(s):
-	"""convert a string into a list of tokens (shlex.split does not apply to c/c++/d)"""
+	"""
+	Convert a string into a list of tokens (shlex.split does not apply to c/c++/d). The results are cached
+	by :py:func:`waflib.Tools.c_preproc.tokenize_private`, and a new list is returned as the callers
+	such as :py:func:`waflib.Tools.c_preproc.reduce_tokens` modify it.
+
+	:param s: line to tokenize
+	:type s: string
+	:rtype: list of tuple(token, value)
+	"""
+	return tokenize_private(s)[:]
+
+@Utils.run_once
+def tokenize_private(s):
 	# the same headers are read again and again - 10% improvement on preprocessing the samba headers
 	ret = []
 	for match in re_clexer.finditer(s):
@@ -595,16 +928,121 @@ def tokenize(s):
 def define_name(line):
 	return re_mac.match(line).group(0)
 
+def is_guarded(lines):
+	"""
+	Detect the headers protected from multiple inclusions by ``#pragma once`` or by an include guard::
+
+		#ifndef FOO_H
+		#define FOO_H
+		...
+		#endif
+
+	:param lines: lines of a file in reverse order, as returned by :py:meth:`waflib.Tools.c_preproc.c_parser.filter_lines`
+	:type lines: list of tuple(string, string)
+	:rtype: bool
+	"""
+	for (token, line) in lines:
+		if token == 'pragma' and re_pragma_once.match(line.lower()):
+			return True
+
+	if len(lines) < 4 or lines[-1][0] != 'ifndef' or lines[-2][0] != 'define':
+		return False
+	m1 = re_mac.match(lines[-1][1])
+	m2 = re_mac.match(lines[-2][1])
+	if not m1 or not m2 or m1.group(0) != m2.group(0):
+		return False
+
+	# the #endif closing the guard must be the last line (lines[0] is POPFILE)
+	depth = 0
+	for i in range(len(lines) - 1, 0, -1):
+		token = lines[i][0]
+		if token[:2] == 'if':
+			depth += 1
+		elif token == 'endif':
+			depth -= 1
+			if not depth:
+				return i == 1
+	return False
+
+class expansion(object):
+	"""
+	Effects of the expansion of a guarded header on a :py:class:`waflib.Tools.c_preproc.c_parser`, recorded
+	so that the header is not parsed again when it is included with the same macros in other files.
+	See :py:meth:`waflib.Tools.c_preproc.c_parser.start_expansion`
+	"""
+	def __init__(self, parser, node):
+		self.node = node
+		self.level = len(parser.currentnode_stack)
+		self.state_level = len(parser.state)
+		self.nodes_start = len(parser.nodes)
+		self.count_start = parser.count_files - 1
+
+		self.reads = {}
+		"""Values of the macros read before being modified (None for the macros not defined)"""
+
+		self.writes = {}
+		"""Macros defined (or undefined with the value None)"""
+
+		self.ban_reads = {}
+		"""Headers looked up in :py:attr:`waflib.Tools.c_preproc.c_parser.ban_includes` before being banned"""
+
+		self.bans = set([])
+		"""Headers added to :py:attr:`waflib.Tools.c_preproc.c_parser.ban_includes`"""
+
+		self.names = []
+		"""Headers not found"""
+
+class macro_table(dict):
+	"""
+	Dict of macros recording the macros read and modified during the header expansions (:py:class:`waflib.Tools.c_preproc.expansion`)
+	"""
+	def __init__(self, *k, **kw):
+		dict.__init__(self, *k, **kw)
+		self.frames = []
+		"""Expansions in progress, innermost last"""
+
+	def lookup(self, k):
+		"""
+		:return: the definition of a macro, or None if it is not defined
+		"""
+		ret = dict.get(self, k)
+		for f in self.frames:
+			if not k in f.reads and not k in f.writes:
+				f.reads[k] = ret
+		return ret
+
+	def __contains__(self, k):
+		return self.lookup(k) is not None
+
+	def __getitem__(self, k):
+		ret = self.lookup(k)
+		if ret is None:
+			raise KeyError(k)
+		return ret
+
+	def __setitem__(self, k, v):
+		dict.__setitem__(self, k, v)
+		for f in self.frames:
+			f.writes[k] = v
+
+	def __delitem__(self, k):
+		dict.__delitem__(self, k)
+		for f in self.frames:
+			f.writes[k] = None
+
 class c_parser(object):
 	def __init__(self, nodepaths=None, defines=None):
 		self.lines = []
 
 		if defines is None:
-			self.defs  = {}
+			self.defs  = macro_table()
 		else:
-			self.defs  = dict(defines) # make a copy
+			self.defs  = macro_table(defines) # make a copy
 		self.state = []
 
+		self.frames = self.defs.frames
+		"""Expansions of the guarded headers in progress, see :py:meth:`waflib.Tools.c_preproc.c_parser.start_expansion`"""
+
 		self.count_files = 0
 		self.currentnode_stack = []
 
@@ -619,17 +1057,22 @@ class c_parser(object):
 
 	def cached_find_resource(self, node, filename):
 		"""
-		this seems to work
+		Find a header from a folder, the results are cached in ``bld.cache_nd``. The nodes are created
+		under :py:const:`waflib.Tools.c_preproc.lock`.
 		"""
-		try:
-			nd = node.ctx.cache_nd
-		except:
-			nd = node.ctx.cache_nd = {}
-
+		nd = shared_cache(node.ctx, 'cache_nd')
 		tup = (node, filename)
 		try:
 			return nd[tup]
 		except KeyError:
+			pass
+
+		lock.acquire()
+		try:
+			try:
+				return nd[tup]
+			except KeyError:
+				pass
 			ret = node.find_resource(filename)
 			try:
 				if not S_ISREG(os.stat(ret.abspath())[ST_MODE]):
@@ -638,6 +1081,8 @@ class c_parser(object):
 				ret = None
 			nd[tup] = ret
 			return ret
+		finally:
+			lock.release()
 
 	def tryfind(self, filename):
 		self.curfile = filename
@@ -656,11 +1101,128 @@ class c_parser(object):
 			if filename[-4:] != '.moc':
 				self.addlines(found)
 		else:
-			if not filename in self.names:
-				self.names.append(filename)
+			self.add_name(filename)
 		return found
 
+	def add_name(self, filename):
+		"""Add a header that could not be found to :py:attr:`waflib.Tools.c_preproc.c_parser.names`"""
+		for f in self.frames:
+			f.names.append(filename)
+		if not filename in self.names:
+			self.names.append(filename)
+
+	def is_banned(self, filename):
+		"""
+		:return: True if the header must not be included again (``#import`` and ``#pragma once``)
+		:rtype: bool
+		"""
+		ret = filename in self.ban_includes
+		for f in self.frames:
+			if not filename in f.bans and not filename in f.ban_reads:
+				f.ban_reads[filename] = ret
+		return ret
+
+	def ban(self, filename):
+		"""Prevent a header from being included again"""
+		self.ban_includes.add(filename)
+		for f in self.frames:
+			f.bans.add(filename)
+
+	def start_expansion(self, node, lines):
+		"""
+		Record the effects of a header on the parser state if it is guarded (:py:func:`waflib.Tools.c_preproc.is_guarded`).
+		The headers with include guards are usually included in many files, but they are parsed once per file, and
+		the expansion of the whole include tree may take most of the time spent in the scanner. When the expansion is
+		complete (:py:meth:`waflib.Tools.c_preproc.c_parser.end_expansion`) the effects are stored in the build context,
+		and the other files including the header with the same macro values can reuse them
+		(:py:meth:`waflib.Tools.c_preproc.c_parser.replay_expansion`).
+
+		:param node: header being parsed
+		:type node: :py:class:`waflib.Node.Node`
+		:param lines: lines of the header
+		:type lines: list of tuple(string, string)
+		"""
+		filepath = node.abspath()
+		try:
+			guarded = self.guards[filepath]
+		except KeyError:
+			guarded = self.guards[filepath] = is_guarded(lines)
+		if guarded:
+			self.frames.append(expansion(self, node))
+
+	def end_expansion(self, f):
+		"""
+		Store the effects of the expansion of a header in :py:attr:`waflib.Tools.c_preproc.c_parser.memo`
+
+		:param f: expansion of a guarded header
+		:type f: :py:class:`waflib.Tools.c_preproc.expansion`
+		"""
+		if len(self.state) != f.state_level:
+			# unbalanced #if/#endif in an included file
+			return
+		entry = (list(f.reads.items()), list(f.ban_reads.items()), list(f.writes.items()), list(f.bans),
+			self.nodes[f.nodes_start:], f.names, self.count_files - f.count_start, self.curfile)
+		self.memo.setdefault(f.node, []).append(entry)
+
+	def replay_expansion(self, node):
+		"""
+		Apply the effects of a previous expansion of a header, if the macros and the headers banned read by the header
+		have the same values, see :py:meth:`waflib.Tools.c_preproc.c_parser.start_expansion`
+
+		:param node: header to include
+		:type node: :py:class:`waflib.Node.Node`
+		:return: True if the header does not have to be parsed
+		:rtype: bool
+		"""
+		try:
+			entries = self.memo[node]
+		except KeyError:
+			return False
+
+		defs = self.defs
+		for entry in entries:
+			(reads, ban_reads, writes, bans, nodes, names, count, curfile) = entry
+			for (k, v) in reads:
+				if dict.get(defs, k) != v:
+					break
+			else:
+				for (k, v) in ban_reads:
+					if (k in self.ban_includes) != v:
+						break
+				else:
+					break
+		else:
+			return False
+
+		debug('preproc: reusing the expansion of %r', node)
+		# the enclosing expansions depend on the same macros
+		for (k, v) in reads:
+			defs.lookup(k)
+		for (k, v) in ban_reads:
+			self.is_banned(k)
+
+		for (k, v) in writes:
+			if v is None:
+				if dict.__contains__(defs, k):
+					del defs[k]
+			else:
+				defs[k] = v
+		for f in self.frames:
+			f.writes.update(writes)
+
+		for x in bans:
+			self.ban(x)
+		self.nodes.extend(nodes)
+		for x in names:
+			self.add_name(x)
+		self.count_files += count
+		self.curfile = curfile
+		return True
+
 	def addlines(self, node):
+		# the file is included from another file, try to reuse a previous expansion
+		if self.currentnode_stack and self.replay_expansion(node):
+			return
 
 		self.currentnode_stack.append(node.parent)
 		filepath = node.abspath()
@@ -675,14 +1237,16 @@ class c_parser(object):
 			pass
 		else:
 			self.lines.extend(lns)
+			if len(self.currentnode_stack) > 1:
+				self.start_expansion(node, lns)
 			return
 
 		try:
-			lines = filter_comments(filepath)
-			lines.append((POPFILE, ''))
-			lines.reverse()
+			lines = self.filter_lines(node)
 			pc[filepath] = lines # cache the lines filtered
 			self.lines.extend(lines)
+			if len(self.currentnode_stack) > 1:
+				self.start_expansion(node, lines)
 		except IOError:
 			raise PreprocError("could not read the file %s" % filepath)
 		except Exception:
@@ -690,15 +1254,51 @@ class c_parser(object):
 				error("parsing %s failed" % filepath)
 				traceback.print_exc()
 
+	def filter_lines(self, node):
+		"""
+		Read the lines of a file for :py:meth:`waflib.Tools.c_preproc.c_parser.addlines`, in reverse order and
+		ending with :py:const:`waflib.Tools.c_preproc.POPFILE`. The lines are reused from the previous builds if the
+		file signature did not change (see :py:func:`waflib.Tools.c_preproc.load_cache`)
+
+		:param node: file to read
+		:type node: :py:class:`waflib.Node.Node`
+		:rtype: list of tuple(string, string)
+		"""
+		filepath = node.abspath()
+		cache = load_cache(node.ctx)
+		sig = None
+		if cache is not None:
+			try:
+				sig = node.get_bld_sig()
+			except (EnvironmentError, AttributeError):
+				# the file will not be read either, or it is a build file not produced yet
+				pass
+			if sig:
+				try:
+					entry = cache['files'][filepath]
+				except KeyError:
+					pass
+				else:
+					if entry[0] == sig:
+						entry[2] = cache['count']
+						return entry[1]
+
+		lines = filter_comments(filepath)
+		lines.append((POPFILE, ''))
+		lines.reverse()
+		if sig:
+			cache['files'][filepath] = [sig, lines, cache['count']]
+		return lines
+
 	def start(self, node, env):
 		debug('preproc: scanning %s (in %s)', node.name, node.parent.name)
 
 		bld = node.ctx
-		try:
-			self.parse_cache = bld.parse_cache
-		except AttributeError:
-			bld.parse_cache = {}
-			self.parse_cache = bld.parse_cache
+		self.parse_cache = shared_cache(bld, 'parse_cache')
+		self.guards = shared_cache(bld, 'preproc_guards')
+
+		# the headers found depend on the include paths
+		self.memo = shared_cache(bld, 'preproc_memo').setdefault(tuple(self.nodepaths), {})
 
 		self.addlines(node)
 
@@ -711,6 +1311,9 @@ class c_parser(object):
 		while self.lines:
 			(token, line) = self.lines.pop()
 			if token == POPFILE:
+				frames = self.frames
+				if frames and frames[-1].level == len(self.currentnode_stack):
+					self.end_expansion(frames.pop())
 				self.currentnode_stack.pop()
 				continue
 
@@ -744,9 +1347,9 @@ class c_parser(object):
 					else: state[-1] = accepted
 				elif token == 'include' or token == 'import':
 					(kind, inc) = extract_include(line, self.defs)
-					if inc in self.ban_includes:
+					if self.is_banned(inc):
 						continue
-					if token == 'import': self.ban_includes.add(inc)
+					if token == 'import': self.ban(inc)
 					if ve: debug('preproc: include found %s    (%s) ', inc, kind)
 					if kind == '"' or not strict_quotes:
 						self.tryfind(inc)
@@ -771,7 +1374,7 @@ class c_parser(object):
 						#print "undef %s" % name
 				elif token == 'pragma':
 					if re_pragma_once.match(line.lower()):
-						self.ban_includes.add(self.curfile)
+						self.ban(self.curfile)
 			except Exception as e:
 				if Logs.verbose:
 					debug('preproc: line parsing failed (%s): %s %s', e, line, Utils.ex_stack())
@@ -801,4 +1404,6 @@ def scan(task):
 	if Logs.verbose:
 		debug('deps: deps for %r: %r; unresolved %r' % (task.inputs, tmp.nodes, tmp.names))
 	return (tmp.nodes, tmp.names)
+scan.thread_safe = True
+"The scanner may be called by several threads at once, see :py:meth:`waflib.Build.BuildContext.prescan_threads`"
 
@@ -105,6 +105,8 @@ class link_task(Task.Task):
 	color   = 'YELLOW'
 	inst_to = None
 	chmod   = Utils.O644
+	resources = {'link': 1}
+	"""Use the resource pool 'link' if it is defined, for example ``waf --pools=link=2``"""
 
 	def add_target(self, target):
 		if isinstance(target, str):
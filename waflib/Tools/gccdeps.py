@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Thomas Nagy, 2008-2010 (ita)
+
+"""
+Use the dependency files (.d) written by gcc, clang or icc during the compilation instead of the
+Waf preprocessor (:py:mod:`waflib.Tools.c_preproc`) for the c, c++ and assembly tasks.
+
+The dependencies are read once the compilation is complete and are used in the next builds,
+so the tasks are always executed when the dependency file is missing (first build, cleaned files).
+The compiler is selected for all the task generators during the configuration::
+
+	def configure(conf):
+		conf.load('gcc gccdeps')
+
+The attribute *scanner* of the task generators selects the dependency scanner of their compilation tasks,
+for example to use the Waf preprocessor for files using computed includes, or to read the dependencies
+of the assembly files produced by gcc::
+
+	def build(bld):
+		bld.program(source='main.c start.S', target='app', scanner='gccdeps')
+		bld.program(source='moc.cpp', target='app2', scanner='c_preproc')
+"""
+
+import os
+from waflib import Task, Logs, Utils, Errors
+from waflib.Tools import c_preproc, c, cxx
+from waflib.TaskGen import after, feature
+
+supported_compilers = ['gcc', 'icc', 'clang']
+"Compilers (CC_NAME, CXX_NAME) enabled by :py:func:`waflib.Tools.gccdeps.configure`"
+
+gccdeps_flags = ['-MMD']
+"Flags added to the compilation commands by default (GCCDEPS_FLAGS), the system headers are not listed with -MMD"
+
+task_flags = {'c': 'CFLAGS', 'cxx': 'CXXFLAGS', 'asm': 'ASFLAGS'}
+"Task classes supported, and the variables holding their flags"
+
+def read_deps(path):
+	"""
+	Read the names of the dependencies from a file written by the compiler, one line at a time. The file
+	contains a single rule in the makefile syntax, and the names may contain escaped spaces::
+
+		main.c.1.o: ../src/main.c ../src/file\\ name.h \\
+		 ../src/config.h
+
+	:param path: path to the dependency file
+	:type path: string
+	:return: file names, absolute or relative to the folder of the compilation
+	:rtype: list of string
+	"""
+	ret = []
+	f = open(path, 'r')
+	try:
+		target = True
+		for line in f:
+			line = line.rstrip('\r\n')
+			more = line.endswith('\\')
+			if more:
+				line = line[:-1]
+			if target:
+				# skip the name of the object file
+				k = line.find(': ')
+				if k < 0 and line.endswith(':'):
+					k = len(line) - 1
+				if k < 0:
+					continue
+				line = line[k + 1:]
+				target = False
+			if '\\' in line or '$' in line:
+				line = line.replace('\\ ', '\0').replace('\\#', '#').replace('$$', '$')
+				ret.extend([x.replace('\0', ' ') for x in line.split()])
+			else:
+				ret.extend(line.split())
+			if not more:
+				break
+	finally:
+		f.close()
+	return ret
+
+def dep_file(self):
+	"""
+	:return: path of the dependency file of a compilation task, written next to the object file
+	:rtype: string
+	"""
+	return os.path.splitext(self.outputs[0].abspath())[0] + '.d'
+
+def find_dep_node(bld, path):
+	"""
+	Obtain the node of a dependency, the results are cached in ``bld.gccdeps_nodes``. The files outside
+	of the project are ignored unless :py:attr:`waflib.Tools.c_preproc.go_absolute` is set.
+	Creating nodes is not thread-safe, so this function is called by the main thread only.
+
+	:param bld: build context
+	:type bld: :py:class:`waflib.Build.BuildContext`
+	:param path: normalized absolute path
+	:type path: string
+	:rtype: :py:class:`waflib.Node.Node` or None
+	"""
+	try:
+		cache = bld.gccdeps_nodes
+	except AttributeError:
+		cache = bld.gccdeps_nodes = {}
+		bld.gccdeps_dirs = (bld.srcnode.abspath() + os.sep, bld.bldnode.abspath() + os.sep)
+
+	try:
+		return cache[path]
+	except KeyError:
+		pass
+
+	node = None
+	if c_preproc.go_absolute or path.startswith(bld.gccdeps_dirs):
+		node = bld.root.find_node(path)
+	cache[path] = node
+	return node
+
+@feature('c', 'cxx', 'asm')
+@after('process_source', 'propagate_uselib_vars')
+def apply_gccdeps(self):
+	"""
+	Select the dependency scanner of the compilation tasks from the attribute *scanner*: 'gccdeps' to read the
+	dependency files for all the tasks, or 'c_preproc' for the Waf preprocessor. By default, the task classes listed
+	in the variable GCCDEPS are enabled. The flags GCCDEPS_FLAGS (:py:const:`waflib.Tools.gccdeps.gccdeps_flags`
+	by default) are added to the variables of :py:const:`waflib.Tools.gccdeps.task_flags`, after the flags
+	of the uselib variables so that the command-lines (and the task signatures) do not change between builds.
+	"""
+	scanner = getattr(self, 'scanner', None)
+	if scanner is None:
+		names = self.env.GCCDEPS
+	elif scanner == 'gccdeps':
+		names = list(task_flags.keys())
+	elif scanner == 'c_preproc':
+		return
+	else:
+		raise Errors.WafError('Invalid scanner %r in %r (use gccdeps or c_preproc)' % (scanner, self))
+
+	flags = self.env.GCCDEPS_FLAGS or gccdeps_flags
+	for tsk in getattr(self, 'compiled_tasks', []):
+		name = tsk.__class__.__name__
+		if name in names and name in task_flags:
+			tsk.gccdeps = True
+			var = task_flags[name]
+			for x in flags:
+				if not x in self.env[var]:
+					self.env.append_value(var, [x])
+
+def wrap(cls):
+	"""
+	Modify a compilation task class so that the tasks having the attribute *gccdeps* set
+	(see :py:func:`waflib.Tools.gccdeps.apply_gccdeps`) use the dependency files
+	"""
+	old_post_run = cls.post_run
+	old_post_run_main = cls.post_run_main
+	old_sig_implicit_deps = cls.sig_implicit_deps
+	old_scan = cls.scan
+
+	def scan(self):
+		"the dependencies are read from the dependency files after the compilation, see post_run"
+		return (self.generator.bld.node_deps.get(self.uid(), []), [])
+
+	def sig_implicit_deps(self):
+		if not getattr(self, 'gccdeps', None):
+			if not old_scan:
+				return Utils.SIG_NIL
+			return old_sig_implicit_deps(self)
+
+		bld = self.generator.bld
+		if os.path.isfile(dep_file(self)):
+			try:
+				return self.compute_sig_implicit_deps()
+			except Errors.TaskNotReady:
+				raise
+			except (EnvironmentError, Errors.WafError):
+				# a header was removed
+				pass
+		Logs.debug('deps: %r must run as its dependencies are unknown' % self)
+		bld.task_sigs.pop(self.uid(), None)
+		return Utils.SIG_NIL
+
+	def post_run(self):
+		if not getattr(self, 'gccdeps', None) or getattr(self, 'cached', None):
+			return old_post_run(self)
+
+		# executed by the consumer threads: only read the file, the nodes are found by post_run_main
+		bld = self.generator.bld
+		try:
+			names = read_deps(dep_file(self))
+		except EnvironmentError:
+			Logs.warn('%r did not write the file %r, it will be executed again' % (self, dep_file(self)))
+			names = []
+		cwd = getattr(self, 'cwd', None) or bld.variant_dir
+		self.dep_paths = [os.path.normpath(os.path.join(cwd, x)) for x in names]
+
+	def post_run_main(self):
+		try:
+			paths = self.dep_paths
+		except AttributeError:
+			return old_post_run_main(self)
+		del self.dep_paths
+
+		bld = self.generator.bld
+		nodes = []
+		for x in paths:
+			node = find_dep_node(bld, x)
+			# ignore the source file, so that successful configuration tests may be retrieved from the cache
+			if node and node is not self.inputs[0]:
+				nodes.append(node)
+
+		Logs.debug('deps: compiler dependencies for %s: %s' % (str(self), str(nodes)))
+
+		key = self.uid()
+		bld.node_deps[key] = nodes
+		bld.raw_deps[key] = []
+		try:
+			del self.cache_sig
+		except AttributeError:
+			pass
+
+		try:
+			old_post_run(self)
+		except Errors.TaskNotReady:
+			# a header produced by a task that was still running was used, compile again in the next build
+			Logs.warn('%r used a file produced by a task not executed before it, it will be executed again' % self)
+			bld.task_sigs.pop(key, None)
+
+	if not old_scan:
+		cls.scan = scan
+	cls.sig_implicit_deps = sig_implicit_deps
+	cls.post_run = post_run
+	cls.post_run_main = post_run_main
+
+def configure(conf):
+	"""
+	Enable the dependency files for the c and c++ tasks (variable GCCDEPS) if the compilers are in
+	:py:const:`waflib.Tools.gccdeps.supported_compilers`. The assembly tasks must be enabled explicitly
+	through the attribute *scanner* of the task generators.
+	"""
+	if conf.env.CC_NAME in supported_compilers:
+		conf.env.append_unique('GCCDEPS', ['c'])
+	if conf.env.CXX_NAME in supported_compilers:
+		conf.env.append_unique('GCCDEPS', ['cxx'])
+
+for name in task_flags:
+	# the class asm exists if the tool gas or nasm was loaded before this one
+	try:
+		cls = Task.classes[name]
+	except KeyError:
+		pass
+	else:
+		wrap(cls)
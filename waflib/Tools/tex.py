@@ -287,9 +287,7 @@ def apply_tex(self):
 		if deps_lst:
 			try:
 				lst = tree.node_deps[task.uid()]
-				for n in deps_lst:
-					if not n in lst:
-						lst.append(n)
+				tree.node_deps[task.uid()] = lst + [n for n in deps_lst if not n in lst]
 			except KeyError:
 				tree.node_deps[task.uid()] = deps_lst
 
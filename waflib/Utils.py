@@ -69,8 +69,46 @@ else:
 			sys.excepthook(*sys.exc_info())
 	threading.Thread.run = run
 
+hash_algo = 'md5'
+"""Name of the hash algorithm used for the signatures, see :py:func:`waflib.Utils.set_hash`"""
+
+def set_hash(algo, size=0):
+	"""
+	Select the hash algorithm used for the task and file signatures. The function :py:func:`waflib.Utils.md5`
+	is replaced, the name is kept for compatibility. The algorithm is chosen during the configuration
+	(``waf configure --hash=blake2b --hash-size=20``) and stored in the build data, the signatures of
+	a previous build are discarded when it changes.
+
+	:param algo: hash algorithm, 'md5', 'sha1' or 'blake2b' (python >= 3.6)
+	:type algo: string
+	:param size: digest size in bytes for blake2b, 32 by default
+	:type size: int
+	"""
+	global md5, hash_algo, SIG_NIL
+	import hashlib
+	if algo == 'md5':
+		fun = hashlib.md5
+	elif algo == 'sha1':
+		fun = hashlib.sha1
+	elif algo == 'blake2b':
+		try:
+			blake2b = hashlib.blake2b
+		except AttributeError:
+			raise Errors.WafError('The blake2b hash requires Python >= 3.6')
+		size = size or 32
+		if size < 1 or size > 64:
+			raise Errors.WafError('Invalid digest size %r for blake2b (1-64)' % size)
+		def fun(*k):
+			return blake2b(*k, digest_size=size)
+		algo = 'blake2b-%d' % size
+	else:
+		raise Errors.WafError('Unknown hash algorithm %r' % algo)
+	md5 = fun
+	hash_algo = algo
+	SIG_NIL = ('iluvcuteoverload' * 4)[:fun().digest_size].encode()
+
 SIG_NIL = 'iluvcuteoverload'.encode()
-"""Arbitrary null value for a md5 hash. This value must be changed when the hash value is replaced (size)"""
+"""Arbitrary null value for a md5 hash, replaced by a value of the digest size by :py:func:`waflib.Utils.set_hash`"""
 
 O644 = 420
 """Constant representing the permissions for regular files (0644 raises a syntax error on python 3)"""
@@ -85,6 +85,7 @@ def setitem(self, key, value):
 	if key.startswith('CCFLAGS'):
 		key = key[1:]
 	self.table[key] = value
+	self.sig_cache = None
 ConfigSet.ConfigSet.__setitem__ = setitem
 
 @TaskGen.feature('d')
@@ -35,6 +35,7 @@ def configure(conf):
 		else:
 			if conf.env['FC']:
 				orig.table = conf.env.get_merged_dict()
+				orig.sig_cache = None
 				conf.env = orig
 				conf.end_msg(True)
 				conf.env.COMPILER_FORTRAN = compiler
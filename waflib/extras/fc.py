@@ -108,7 +108,8 @@ class fc(Task.Task):
 					node = bld.srcnode.find_resource(name)
 					if node and node not in tsk.outputs:
 						if not node in bld.node_deps[key]:
-							bld.node_deps[key].append(node)
+							# new list: the build data journal only saves the values replaced
+							bld.node_deps[key] = bld.node_deps[key] + [node]
 						ins[id(node)].add(tsk)
 
 		# if the intersection matches, set the order